@@ -1,22 +1,54 @@
 import os
+import argparse
 
 from speaker import Speaker
-from speaker.client import ClientAirplay, ClientBluetooth
+from speaker.client import (
+    ClientAirplay, ClientBluetooth, ClientSnapcast, ClientMPD)
 from speaker.display import DisplayST7789
 from speaker.control import ControlPirateAudio
+from speaker.runtime import AsyncRuntime
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--asyncio', action='store_true',
+        help='run the speaker on an asyncio event loop')
+    parser.add_argument(
+        '--stats', action='store_true',
+        help='collect frame timing stats, print them on exit')
+    parser.add_argument(
+        '--hud', action='store_true',
+        help='show fps and frame times on the display')
+    parser.add_argument(
+        '--snapcast', metavar='HOST',
+        help='show the snapclient of this speaker from snapserver on HOST')
+    parser.add_argument(
+        '--mpd', metavar='HOST', help='show mpd running on HOST')
+    args = parser.parse_args()
+
     cache_dir = os.path.realpath('./cache')
     os.makedirs(cache_dir, exist_ok=True)
     sp = Speaker(
         display=DisplayST7789,
         control=ControlPirateAudio,
         intro=True, outro=True,
-        cache_dir=cache_dir)
+        cache_dir=cache_dir,
+        stats=args.stats, hud=args.hud)
     sp.add_client(ClientAirplay)
     sp.add_client(ClientBluetooth)
-    sp.run()
+    if args.snapcast:
+        sp.add_client(ClientSnapcast, host=args.snapcast)
+    if args.mpd:
+        sp.add_client(ClientMPD, host=args.mpd)
+    if args.asyncio:
+        AsyncRuntime(sp).run()
+    else:
+        sp.run()
+    if args.stats:
+        for name, summary in sp.get_stats().items():
+            print(f'{name}: {summary}')
+        print(f'input_latency: {sp.get_input_latency()}')
 
 
 
@@ -1,10 +1,16 @@
-from threading import Thread
-import pulsectl
-import alsaaudio
+from threading import Thread, Condition
+from concurrent.futures import ThreadPoolExecutor
+import os
+import heapq
 import time
 
+from .cache import ArtCache
+from .mixer import Mixer
+from .pulse import PulseEvents
+from .stats import FrameStats
 from .scene import (
     SceneClient, SceneDefault, SceneIntro, SceneOutro)
+from .scene.client import controls
 
 
 __version__ = '0.0.1'
@@ -14,6 +20,16 @@ class Speaker:
 
     '''
     Represents the speaker
+
+    The main loop is event driven. After rendering it sleeps until the
+    next deadline of the display, the clients or the display timeout,
+    or until wakeup() is called by another thread. The display deadlines
+    follow the pacing declared by the scene and overlay, fps is the
+    upper limit.
+
+    Commands of the controls are handled by the render loop at the start
+    of every pass, slow client actions are run by call_action() in the
+    action thread.
     '''
 
     MAX_BRIGHTNESS = 80
@@ -24,48 +40,69 @@ class Speaker:
     control = None
 
     def __init__(
-            self, display, control, cache_dir, update_interval=1,
-            display_timeout=8, fps=30, intro=True, outro=True):
+            self, display, control, cache_dir, display_timeout=8, fps=30,
+            intro=True, outro=True, async_flush=False, stats=False,
+            hud=False, art_cache_size=32 * 1024 * 1024,
+            art_cache_memory=False):
+
+        self._wakeup = Condition()
+        self._deadlines = []
+        self._woken = False
+        self._last_render = 0
 
         self.client = None
-        self.display = display(self)
+        self.display = display(self, async_flush=async_flush)
+        self._stats = FrameStats() if stats or hud else None
+        if self._stats:
+            self.display.set_stats(self._stats, hud=hud)
         self.control = control(self)
-        self.mixer = alsaaudio.Mixer()
+        self.mixer = Mixer()
+        self.mixer.add_listener(self._on_mixer_changed)
+        self.art_cache = ArtCache(
+            None if art_cache_memory else os.path.join(cache_dir, 'art'),
+            budget=art_cache_size)
 
         self._thread = Thread(target=self._thread_fn, daemon=True)
+        self._actions = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='action')
         self._clients = []
-        self._event = None
         self._running = False
         self._active = False
         self._anim = False
         self._brightness = 0
         self._active_timer = 0
         self._cache_dir = cache_dir
-        self._update_interval = update_interval
         self._display_timeout = display_timeout
         self._fps = fps
         self._intro = intro
         self._outro = outro
 
     def _thread_fn(self):
-        with pulsectl.Pulse() as pulse:
-            pulse.event_mask_set('all')
-            pulse.event_callback_set(self._event_handler)
+        with PulseEvents(self._clients) as pulse_events:
+            pulse_events.sync()
+            self._check_client()
+            self.wakeup()
             while self._running:
-                pulse.event_listen()
-                event = self._event
-                client = None
-                for c in sorted(self._clients, key=lambda c: c.PRIORITY):
-                    c.update_event(event, pulse)
-                    if not client and c.is_active():
-                        client = c
-                        break
-                if client != self.client:
-                    self.set_client(client)
-
-    def _event_handler(self, ev):
-        self._event = ev
-        raise pulsectl.PulseLoopStop
+                events = pulse_events.listen()
+                if events:
+                    self._handle_pulse_events(events, pulse_events)
+
+    def _handle_pulse_events(self, events, pulse_events):
+        pulse_events.dispatch(events)
+        self._check_client()
+        self.wakeup()
+
+    def _check_client(self):
+        '''
+        Selects the active client with the highest priority
+        '''
+        client = None
+        for c in self._clients:
+            if c.is_active():
+                client = c
+                break
+        if client != self.client:
+            self.set_client(client)
 
     def is_active(self):
         return self._active
@@ -80,15 +117,48 @@ class Speaker:
             self._brightness = brightness
         self._active_timer = time.time()
         self._active = active
+        self.wakeup()
+
+    def wakeup(self, deadline=None):
+        '''
+        Wakes up the main loop now or at deadline (in time.time() units)
+        '''
+        with self._wakeup:
+            if deadline is None:
+                self._woken = True
+            else:
+                heapq.heappush(self._deadlines, deadline)
+            self._wakeup.notify()
+
+    def call_action(self, fn, *args, **kwargs):
+        '''
+        Runs a slow client action (d-bus call, mixer write) in the action
+        thread, returns a future
+        '''
+        future = self._actions.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._on_action_done)
+        return future
+
+    def _on_action_done(self, future):
+        if not future.cancelled() and future.exception():
+            print(f'client action failed: {future.exception()!r}')
+        self.wakeup()
+
+    def _on_mixer_changed(self, volume, muted):
+        self.wakeup()
 
     def get_cache_dir(self):
         return self._cache_dir
 
+    def get_art_cache(self):
+        return self.art_cache
+
     def get_clients(self):
         return self._clients
 
     def add_client(self, client, *args, **kwargs):
         self._clients.append(client(self, *args, **kwargs))
+        self._clients.sort(key=lambda c: c.PRIORITY)
 
     def set_client(self, client):
         if client and client != self.client:
@@ -107,11 +177,14 @@ class Speaker:
                     opacity=0.5,
                     fade_out=True)
         self.client = client
+        self.wakeup()
 
     def run(self):
         try:
+            self.mixer.start()
             self.control.start()
             self.display.start()
+            self._prepare()
             if self._intro:
                 self._show_intro()
             self._running = True
@@ -127,62 +200,128 @@ class Speaker:
                 c.stop()
             self.control.stop()
             self.display.stop()
+            self.mixer.stop()
+            self._actions.shutdown(wait=False)
             if self._thread.is_alive():
                 self._thread.join(timeout=1)
             if not isinstance(e, KeyboardInterrupt):
                 raise e
 
+    def _prepare(self):
+        '''
+        Prepares shared resources before the first client connects
+        '''
+        controls.prepare(self.display.get_size())
+
     def _show_intro(self):
-        last_update = 0
-        self.display.set_scene(SceneIntro)
-        while True:
-            self._update()
-            scene = self.display.get_scene()
-            if not scene or not scene.is_active():
-                break
-            display_update = self.display.update()
-            if not display_update:
-                if time.time() - last_update < float(self._update_interval):
-                    time.sleep(1.0 / self._fps)
-                    continue
-            if display_update:
-                self.display.redraw()
-            last_update = time.time()
+        self._show_scene(SceneIntro)
 
     def _show_outro(self):
-        last_update = 0
-        self.display.set_scene(SceneOutro)
+        self._show_scene(SceneOutro)
+
+    def _show_scene(self, scene):
+        self.display.set_scene(scene)
         while True:
             self._update()
             scene = self.display.get_scene()
             if not scene or not scene.is_active():
                 break
-            display_update = self.display.update()
-            if not display_update:
-                if time.time() - last_update < float(self._update_interval):
-                    time.sleep(1.0 / self._fps)
-                    continue
-            if display_update:
-                self.display.redraw()
-            last_update = time.time()
+            self._render()
+            self._wait()
 
     def _run_loop(self):
-        last_update = 0
         while True:
             self._update()
-            display_update = self.display.update()
-            if not display_update:
-                if time.time() - last_update < float(self._update_interval):
-                    time.sleep(1.0 / self._fps)
+            self._render()
+            self._wait()
+
+    def get_stats(self):
+        '''
+        Returns a summary of the frame timing stats or None if disabled
+        '''
+        if self._stats:
+            return self._stats.get_summary()
+        return None
+
+    def get_input_latency(self):
+        '''
+        Returns a summary of the latency from button to display in seconds
+        '''
+        return self.display.get_input_latency()
+
+    def _render(self):
+        self._last_render = time.time()
+        if self._stats:
+            self._render_timed()
+        elif self.display.update():
+            self.display.redraw()
+
+    def _render_timed(self):
+        stats = self._stats
+        bytes_written = self.display.get_bytes_written()
+        start = time.perf_counter()
+        changed = self.display.update()
+        updated = time.perf_counter()
+        stats.add('display', updated - start)
+        if changed:
+            self.display.redraw()
+            end = time.perf_counter()
+            stats.add('redraw', end - updated)
+            stats.frame(
+                self.display.get_scene(), end - start,
+                self.display.get_bytes_written() - bytes_written)
+
+    def get_next_deadline(self):
+        '''
+        Returns the time of the next required render pass or None
+
+        The deadlines come from the pacing of the scene and overlay, the
+        clients and the display timeout, limited to fps.
+        '''
+        if self.is_anim():
+            deadline = 0
+        else:
+            deadlines = [self.display.get_deadline()]
+            deadlines += [c.get_deadline() for c in self.get_clients()]
+            if self.is_active():
+                deadlines.append(
+                    self._active_timer + float(self._display_timeout))
+            deadlines = [d for d in deadlines if d is not None]
+            if not deadlines:
+                return None
+            deadline = min(deadlines)
+        # never render faster than fps
+        return max(deadline, self._last_render + 1.0 / self._fps)
+
+    def _wait(self):
+        deadline = self.get_next_deadline()
+        with self._wakeup:
+            while not self._woken:
+                now = time.time()
+                if self._deadlines and self._deadlines[0] <= now:
+                    heapq.heappop(self._deadlines)
+                    break
+                timeouts = [d for d in (deadline, *self._deadlines[:1])
+                            if d is not None]
+                if not timeouts:
+                    self._wakeup.wait()
                     continue
-            if display_update or self.is_active():
-                self.display.redraw()
-            last_update = time.time()
+                timeout = min(timeouts) - now
+                if timeout <= 0:
+                    break
+                self._wakeup.wait(timeout)
+            self._woken = False
 
     def _update(self):
+        self.control.process()
         if self._running:
+            start = self._stats and time.perf_counter()
             for c in self.get_clients():
                 c.update()
+            # clients not driven by pulse change their state on update
+            self._check_client()
+            if self._stats:
+                self._stats.add('clients', time.perf_counter() - start)
         self._check_display_timeout()
         self._check_scene()
         if not self._check_display_brightness():
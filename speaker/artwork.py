@@ -0,0 +1,102 @@
+import io
+import queue
+import hashlib
+
+from collections import OrderedDict
+from threading import Thread, Lock
+
+from PIL import Image, ImageFilter
+
+
+class ArtworkRenderer:
+
+    '''
+    Renders album art background layers in a worker thread
+
+    Album art is decoded once per content hash, using JPEG draft mode to
+    decode at a reduced scale, and the final layer (resized, blurred and
+    composited with the given alpha over black) is cached. get_layer()
+    never blocks, it returns None until the layer is ready and calls the
+    given callback once it is.
+
+    With an ArtCache the rendered layers are also stored as renditions,
+    so art seen before is loaded without decoding.
+    '''
+
+    CACHE_SIZE = 8
+
+    def __init__(self, cache_size=CACHE_SIZE):
+        self._lock = Lock()
+        self._layers = OrderedDict()
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._cache_size = cache_size
+        self._last_data = None
+        self._last_hash = None
+
+    def _get_hash(self, data):
+        # the same bytes object is passed on every frame
+        if data is not self._last_data:
+            self._last_hash = hashlib.sha1(data).hexdigest()
+            self._last_data = data
+        return self._last_hash
+
+    def get_layer(self, data, size, blur=False, alpha=96, callback=None,
+                  key=None, cache=None):
+        key = (key or self._get_hash(data), tuple(size), blur, alpha)
+        with self._lock:
+            layer = self._layers.get(key)
+            if layer is not None:
+                self._layers.move_to_end(key)
+                return layer
+            if key in self._pending:
+                return None
+            self._pending.add(key)
+            if not self._thread:
+                self._thread = Thread(target=self._thread_fn, daemon=True)
+                self._thread.start()
+        self._queue.put((key, data, callback, cache))
+        return None
+
+    def render(self, data, size, blur=False, alpha=96):
+        '''
+        Renders a background layer, blocking
+        '''
+        image = Image.open(io.BytesIO(data))
+        # let the jpeg decoder scale down while decoding
+        image.draft('RGB', size)
+        image = image.convert('RGB').resize(size).convert('RGBA')
+        if blur:
+            image = image.filter(ImageFilter.GaussianBlur(radius=5))
+        image.putalpha(alpha)
+        layer = Image.new('RGBA', size, '#000')
+        layer.alpha_composite(image)
+        return layer
+
+    def _thread_fn(self):
+        while True:
+            key, data, callback, cache = self._queue.get()
+            art_id, size, blur, alpha = key
+            variant = f'{"blur" if blur else "sharp"}{alpha}'
+            layer = None
+            if cache:
+                layer = cache.get_rendition(art_id, size, variant)
+            if layer is None:
+                try:
+                    layer = self.render(data, size, blur=blur, alpha=alpha)
+                    if cache:
+                        cache.put_rendition(art_id, size, layer, variant)
+                except Exception as e:
+                    print(f'could not render album art: {e!r}')
+                    layer = Image.new('RGBA', size, '#000')
+            with self._lock:
+                self._pending.discard(key)
+                self._layers[key] = layer
+                while len(self._layers) > self._cache_size:
+                    self._layers.popitem(last=False)
+            if callback:
+                callback()
+
+
+artwork = ArtworkRenderer()
@@ -0,0 +1,381 @@
+'''
+Rendering microbenchmarks
+
+Run all benchmarks and write the results as json, without -o to
+stdout:
+
+    python -m speaker.bench -o results.json
+
+Compare two result files, exits with 1 if a benchmark got slower than
+the threshold:
+
+    python -m speaker.bench --compare old.json new.json
+'''
+
+import io
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import platform
+import resource
+import contextlib
+import tracemalloc
+
+import PIL
+
+from fonts.ttf import RobotoMedium as UserFont
+from PIL import Image, ImageDraw, ImageFont
+
+from . import __version__
+from .artwork import artwork
+from .cache import ArtCache
+from .client import Client, ClientInfo, ClientAirplay
+from .display import DisplayHeadless
+from .draw import ImageMap, OverlayButtonPlay, OverlayIconAirplay, IconAirplay
+from .scene import SceneClient, SceneDefault
+from .utils import text_in_rect, image_tint
+
+
+IMAGE_DIR = os.path.join(os.path.dirname(__file__), 'images')
+SHORT_TITLE = 'Intro'
+LONG_TITLE = (
+    'A very long song title that needs to be wrapped over multiple '
+    'lines and scaled down to fit')
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    '''
+    Registers a benchmark, the function sets it up and returns the
+    callable to measure
+    '''
+    def decorator(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return decorator
+
+
+class BenchClient(Client):
+
+    OVERLAY = OverlayIconAirplay
+    ICON = IconAirplay
+
+    def __init__(self, speaker, album_art=None):
+        super().__init__(speaker)
+        self._active = True
+        self.set_info(
+            artist='Artist', title=LONG_TITLE, album='Album', volume=40,
+            position=10, duration=200, status=ClientInfo.STATUS_PLAYING,
+            album_art=album_art)
+
+    def get_volume(self):
+        return self.get_info().volume
+
+
+class BenchSpeaker:
+
+    '''
+    Speaker without pulse, mixer and controls for the benchmarks
+    '''
+
+    MAX_BRIGHTNESS = 80
+    MAX_VOLUME = 100
+
+    def __init__(self):
+        self.client = None
+        self.art_cache = ArtCache()
+        self._clients = []
+        self.display = DisplayHeadless(self)
+
+    def get_clients(self):
+        return self._clients
+
+    def get_cache_dir(self):
+        return None
+
+    def get_art_cache(self):
+        return self.art_cache
+
+    def is_active(self):
+        return True
+
+    def is_anim(self):
+        return False
+
+    def wakeup(self, deadline=None):
+        return
+
+
+def make_album_art(size=(600, 600)):
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    data = io.BytesIO()
+    image.save(data, format='JPEG', quality=90)
+    return data.getvalue()
+
+
+def make_metadata(album_art):
+    def item(type, code, data=None):
+        res = (f'<item><type>{type.encode().hex()}</type>'
+               f'<code>{code.encode().hex()}</code><length>0</length>')
+        if data is not None:
+            res += ('<data encoding="base64">\n'
+                    + base64.encodebytes(data).decode() + '</data>')
+        return res + '</item>\n'
+    return (
+        item('ssnc', 'mdst')
+        + item('core', 'asar', b'Artist')
+        + item('core', 'minm', LONG_TITLE.encode())
+        + item('core', 'asal', b'Album')
+        + item('core', 'asgn', b'Genre')
+        + item('ssnc', 'prgr', b'1000/45100/8821000')
+        + item('ssnc', 'pvol', b'-15.00,-20.00,-30.00,0.00')
+        + item('ssnc', 'PICT', album_art)
+        + item('ssnc', 'mden'))
+
+
+def _get_canvas():
+    return ImageDraw.Draw(Image.new('RGBA', (240, 240)))
+
+
+@benchmark('text_in_rect_short')
+def bench_text_in_rect_short():
+    canvas = _get_canvas()
+    font = ImageFont.truetype(UserFont, 42)
+    return lambda: text_in_rect(canvas, SHORT_TITLE, font, (4, 84, 236, 192))
+
+
+@benchmark('text_in_rect_long')
+def bench_text_in_rect_long():
+    canvas = _get_canvas()
+    font = ImageFont.truetype(UserFont, 42)
+    return lambda: text_in_rect(canvas, LONG_TITLE, font, (4, 84, 236, 192))
+
+
+@benchmark('text_in_rect_long_new')
+def bench_text_in_rect_long_new():
+    # a new title on every call, like on a track change
+    canvas = _get_canvas()
+    font = ImageFont.truetype(UserFont, 42)
+    counter = iter(range(sys.maxsize))
+    return lambda: text_in_rect(
+        canvas, f'{LONG_TITLE} {next(counter)}', font, (4, 84, 236, 192))
+
+
+@benchmark('image_tint')
+def bench_image_tint():
+    image = ImageMap(os.path.join(IMAGE_DIR, 'icons_256.png')).image
+    sprite = image.crop((0, 0, image.size[1], image.size[1]))
+    return lambda: image_tint(sprite, '#aaa')
+
+
+@benchmark('imagemap_get')
+def bench_imagemap_get():
+    image_map = ImageMap(
+        os.path.join(IMAGE_DIR, 'buttons_256.png'), foreground='#aaa')
+    return lambda: image_map.get(1, size=(64, 64))
+
+
+@benchmark('overlay_draw_overlay')
+def bench_overlay_draw_overlay():
+    speaker = BenchSpeaker()
+    overlay = OverlayButtonPlay(speaker.display)
+    sprite = overlay._overlay.get(overlay._idx)
+    return lambda: overlay._draw_overlay(sprite)
+
+
+def _bench_scene_client(album_art):
+    speaker = BenchSpeaker()
+    client = BenchClient(speaker, album_art=album_art)
+    speaker.client = client
+    speaker.display.set_scene(SceneClient)
+    scene = speaker.display.get_scene()
+    # wait for the album art layer
+    timeout = time.time() + 10
+    while album_art and time.time() < timeout:
+        scene.update()
+        if artwork.get_layer(
+                album_art, speaker.display.get_size(),
+                cache=speaker.get_art_cache()):
+            break
+        time.sleep(0.01)
+    counter = iter(range(sys.maxsize))
+
+    def update():
+        # position changes every second while playing
+        client.set_info(position=next(counter) % 200)
+        scene.update()
+    return update
+
+
+@benchmark('scene_client_update')
+def bench_scene_client_update():
+    return _bench_scene_client(None)
+
+
+@benchmark('scene_client_update_art')
+def bench_scene_client_update_art():
+    return _bench_scene_client(make_album_art())
+
+
+@benchmark('scene_default_draw')
+def bench_scene_default_draw():
+    speaker = BenchSpeaker()
+    speaker._clients.append(BenchClient(speaker))
+    scene = SceneDefault(speaker.display)
+    image = Image.new('RGBA', speaker.display.get_size())
+    return lambda: scene._draw_default(image)
+
+
+@benchmark('display_update_blend')
+def bench_display_update_blend():
+    speaker = BenchSpeaker()
+    speaker.client = BenchClient(speaker)
+    display = speaker.display
+    display.set_scene(SceneClient)
+    display.set_overlay(OverlayButtonPlay, duration=0)
+    display.update()
+    overlay = display.get_overlay()
+
+    def update():
+        # force a blend without cached frames
+        overlay._draw = True
+        display._fade.clear()
+        display.update()
+    return update
+
+
+@benchmark('airplay_parse_data')
+def bench_airplay_parse_data():
+    speaker = BenchSpeaker()
+    # no metadata pipe and d-bus needed to parse
+    client = ClientAirplay.__new__(ClientAirplay)
+    Client.__init__(client, speaker)
+    data = make_metadata(make_album_art())
+    return lambda: client._parse_data(data)
+
+
+def measure(fn, min_time=1.0, repeat=3, alloc_calls=20):
+    '''
+    Returns ops/sec and the python allocations per call of fn
+
+    fn is run in repeat rounds of min_time / repeat, the fastest round
+    is reported to reduce noise from other processes.
+    '''
+    fn()
+    calls = 0
+    best = 0
+    for _ in range(repeat):
+        count = 0
+        start = time.perf_counter()
+        elapsed = 0
+        while elapsed < min_time / repeat:
+            fn()
+            count += 1
+            elapsed = time.perf_counter() - start
+        calls += count
+        best = max(best, count / elapsed)
+    # pillow image buffers are not traced, only python allocations
+    tracemalloc.start()
+    peak = 0
+    for _ in range(alloc_calls):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return {
+        'ops_per_sec': best,
+        'calls': calls,
+        'alloc_bytes_per_call': peak // alloc_calls}
+
+
+def run(names=None, min_time=1.0):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if names and not any(n in name for n in names):
+            continue
+        res = measure(setup(), min_time=min_time)
+        print(f'{name:28} {res["ops_per_sec"]:10.1f} ops/s '
+              f'{res["alloc_bytes_per_call"]:10} B/call', file=sys.stderr)
+        results[name] = res
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'machine': platform.machine(),
+        'time': time.time(),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'results': results}
+
+
+def compare(old, new, threshold=0.1):
+    '''
+    Prints the change of two result files, returns the regressions
+    '''
+    regressions = []
+    print(f'{"benchmark":28} {"old ops/s":>10} {"new ops/s":>10} '
+          f'{"change":>8} {"old B":>8} {"new B":>8}')
+    for name, res in new['results'].items():
+        old_res = old['results'].get(name)
+        if not old_res:
+            print(f'{name:28} {"-":>10} {res["ops_per_sec"]:10.1f}')
+            continue
+        change = res['ops_per_sec'] / old_res['ops_per_sec'] - 1
+        mark = ''
+        if change < -threshold:
+            regressions.append(name)
+            mark = ' !'
+        print(f'{name:28} {old_res["ops_per_sec"]:10.1f} '
+              f'{res["ops_per_sec"]:10.1f} {change:+8.1%} '
+              f'{old_res["alloc_bytes_per_call"]:8} '
+              f'{res["alloc_bytes_per_call"]:8}{mark}')
+    print(f'peak rss: {old["peak_rss_kb"]} kB -> {new["peak_rss_kb"]} kB')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m speaker.bench', description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        'names', nargs='*', help='only run benchmarks containing a name')
+    parser.add_argument('-o', '--output', help='write results to file')
+    parser.add_argument(
+        '-t', '--time', type=float, default=1.0,
+        help='minimum time per benchmark in seconds')
+    parser.add_argument(
+        '--compare', nargs=2, metavar=('OLD', 'NEW'),
+        help='compare two result files')
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='slowdown reported as regression when comparing')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = compare(old, new, threshold=args.threshold)
+        if regressions:
+            print(f'regressions: {", ".join(regressions)}')
+            sys.exit(1)
+        return
+
+    # scenes and overlays print while being created, keep stdout for
+    # the json
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args.names, min_time=args.time)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import os
+import time
+import hashlib
+import tempfile
+
+from collections import OrderedDict
+from threading import Lock
+
+from PIL import Image
+
+
+class ArtCache:
+
+    '''
+    Content addressed album art cache
+
+    Originals are stored by their sha1 hash, display-size renditions are
+    stored next to them as raw RGBA, so they can be loaded without
+    decoding. Files are written atomically. When the total size exceeds
+    the byte budget the least recently used entries are evicted.
+
+    Without a path the cache is kept in memory only, which avoids SD
+    card writes. A path on a tmpfs has the same effect but survives
+    restarts of the speaker.
+    '''
+
+    def __init__(self, path=None, budget=32 * 1024 * 1024):
+        self._path = path
+        self._budget = budget
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._data = {}
+        self._size = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._scan()
+
+    @staticmethod
+    def get_key(data):
+        return hashlib.sha1(data).hexdigest()
+
+    def get_size(self):
+        return self._size
+
+    def _scan(self):
+        files = []
+        for name in os.listdir(self._path):
+            if name.startswith('.'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self._path, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+        self._evict()
+
+    def _get_rendition_name(self, key, size, variant=''):
+        name = f'{key}_{size[0]}x{size[1]}'
+        if variant:
+            name += f'_{variant}'
+        return f'{name}.rgba'
+
+    def _read(self, name):
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+            if not self._path:
+                return self._data[name]
+        file = os.path.join(self._path, name)
+        try:
+            with open(file, 'rb') as f:
+                data = f.read()
+            # mtime is used as access time to restore the lru order
+            os.utime(file, (time.time(), time.time()))
+        except OSError:
+            with self._lock:
+                self._size -= self._entries.pop(name, 0)
+            return None
+        return data
+
+    def _write(self, name, data):
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                return
+        if self._path:
+            fd, tmp = tempfile.mkstemp(dir=self._path, prefix='.')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                    # make sure the data is on disk before the rename,
+                    # a power cut could leave an empty file otherwise
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, os.path.join(self._path, name))
+            except OSError:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+                return
+        with self._lock:
+            if not self._path:
+                self._data[name] = bytes(data)
+            self._entries[name] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self._budget and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            if self._path:
+                try:
+                    os.unlink(os.path.join(self._path, name))
+                except OSError:
+                    pass
+            else:
+                self._data.pop(name, None)
+
+    def put(self, data):
+        '''
+        Stores the original art, returns its key
+        '''
+        key = self.get_key(data)
+        self._write(key, data)
+        return key
+
+    def get(self, key):
+        return self._read(key)
+
+    def get_rendition(self, key, size, variant=''):
+        data = self._read(self._get_rendition_name(key, size, variant))
+        if data is None or len(data) != size[0] * size[1] * 4:
+            return None
+        return Image.frombytes('RGBA', size, data)
+
+    def put_rendition(self, key, size, image, variant=''):
+        self._write(
+            self._get_rendition_name(key, size, variant), image.tobytes())
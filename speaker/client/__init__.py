@@ -1,3 +1,5 @@
-from .client import Client, ClientInfo
+from .client import Client, ClientInfo, ClientPush
 from .airplay import ClientAirplay
 from .bluetooth import ClientBluetooth
+from .snapcast import ClientSnapcast
+from .mpd import ClientMPD
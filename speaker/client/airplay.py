@@ -1,40 +1,45 @@
-import os
 import time
-import untangle
-import xml
 import dbus
 
-from base64 import decodebytes
-
-from ..utils import bytes_to_file, translate
+from ..utils import translate
 from ..draw import OverlayIconAirplay, IconAirplay
 from .client import Client, FIFO, ClientInfo
+from .shairport import MetadataParser, MetadataReader
 
 
 class ClientAirplay(Client):
 
     OVERLAY = OverlayIconAirplay
     ICON = IconAirplay
+    PULSE_FACILITIES = ('sink_input',)
     UPDATE_INTERVAL = 1
     PIPE = '/tmp/shairport-sync-metadata'
+    HANDLERS = {
+        ('ssnc', 'PICT'): '_on_album_art',
+        ('core', 'asal'): '_on_album',
+        ('core', 'asar'): '_on_artist',
+        ('core', 'minm'): '_on_title',
+        ('ssnc', 'prsm'): '_on_play',
+        ('ssnc', 'pend'): '_on_stop',
+        ('ssnc', 'prgr'): '_on_progress',
+        ('ssnc', 'pvol'): '_on_volume',
+    }
 
     def __init__(self, speaker):
         super().__init__(speaker)
         self._last_update = 0
         self._sink_input = None
         self._init_volume = None
-        self._client_info = ClientInfo()
+        self._watched = False
         self.fifo = FIFO(self.PIPE, eol='</item>', skip_create=True)
+        self._reader = MetadataReader(
+            self.fifo, self.HANDLERS, callback=self._on_metadata,
+            prepare=self._prepare)
         self._init_dbus()
 
-    def _check_pulse(self, pulse):
-        found = False
-        for s in pulse.sink_input_list():
-            if s.proplist.get('application.name') == 'Shairport Sync':
-                found = True
-                self._sink_input = s.index
-        if not found:
-            self._sink_input = None
+    def _check_pulse(self, mirror):
+        sink_inputs = mirror.get_sink_inputs('Shairport Sync')
+        self._sink_input = sink_inputs[-1].index if sink_inputs else None
 
     def _init_dbus(self):
         bus = dbus.SystemBus()
@@ -52,87 +57,80 @@ class ClientAirplay(Client):
         self._fn_volup = interface.get_dbus_method("VolumeUp")
         self._fn_voldown = interface.get_dbus_method("VolumeDown")
 
+    def _on_metadata(self):
+        # called from the reader thread
+        self.get_speaker().wakeup()
+
+    def _prepare(self, handler, data):
+        # called from the reader thread, hashing and writing the art
+        # would stall the render thread
+        if handler == '_on_album_art':
+            album_art_id = None
+            if data:
+                album_art_id = self.get_speaker().get_art_cache().put(data)
+            return data, album_art_id
+        return data
+
     def _update_info(self):
-        while True:
-            data = self.fifo.read()
-            if data is None or len(data) == 0:
-                return
-            else:
-                self._parse_data(data)
+        for handler, data in self._reader.get():
+            getattr(self, handler)(data)
 
     def _parse_data(self, data):
-        try:
-            data = untangle.parse(data)
-        except (xml.sax.SAXException, AttributeError):
-            return
-
-        dtype = bytes.fromhex(data.item.type.cdata).decode('ascii')
-        dcode = bytes.fromhex(data.item.code.cdata).decode('ascii')
-
-        data = getattr(data.item, 'data', None)
-        if data is not None:
-            encoding = data['encoding']
-            data = data.cdata
-            if encoding == 'base64':
-                data = decodebytes(data.encode('ascii'))
-
-        if (dtype, dcode) == ('ssnc', 'PICT'):
-            dir = self.get_speaker().get_cache_dir()
-            file = os.path.join(dir, 'airplay_current.jpg')
-            if data is not None:
-                bytes_to_file(data, file)
-            self._client_info.album_art = data
-
-        elif (dtype, dcode) == ('core', 'asal'):  # Album
-            self._client_info.album = (
-                '' if data is None else data.decode('utf-8'))
-
-        elif (dtype, dcode) == ('core', 'asar'):  # Artist
-            self._client_info.artist = (
-                '' if data is None else data.decode('utf-8'))
-
-        elif (dtype, dcode) == ('core', 'minm'):  # Song Name / Item
-            self._client_info.title = (
-                '' if data is None else data.decode('utf-8'))
-
-        elif (dtype, dcode) == ('ssnc', 'prsm'):
-            self._client_info.status = ClientInfo.STATUS_PLAYING
-
-        elif (dtype, dcode) == ('ssnc', 'pend'):
-            self._client_info.status = ClientInfo.STATUS_STOPPED
-
-        elif (dtype, dcode) == ('ssnc', 'prgr'):
-            times = ('' if data is None else data.decode('utf-8'))
-            if times:
-                times = times.split('/')
-                times = [int(x) for x in times]
-
-                self._client_info.duration = (times[2]-times[0])/44100
-                self._client_info.position = (times[1]-times[0])/44100
-
-        elif (dtype, dcode) == ('ssnc', 'pvol'):
-            volumes = '' if data is None else data.decode('utf-8')
-            if volumes:
-                volumes = volumes.split(',')
-                volumes = [float(x) for x in volumes]
-                volume = translate(
-                    volumes[1],
-                    volumes[2], volumes[3],
-                    0, 100)
-                self._client_info.volume = int(volume)
-                if volume < 5:
-                    self._client_info.muted = True
-                else:
-                    self._client_info.muted = False
-
-    def get_info(self) -> ClientInfo:
-        return self._client_info
+        '''
+        Parses and applies complete metadata items
+        '''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        parser = MetadataParser(accept=lambda t, c: (t, c) in self.HANDLERS)
+        for item in parser.feed(data):
+            handler = self.HANDLERS[(item.type, item.code)]
+            getattr(self, handler)(self._prepare(handler, item.data))
+
+    def _on_album_art(self, art):
+        data, album_art_id = art
+        self.set_info(album_art=data, album_art_id=album_art_id)
+
+    def _on_album(self, data):
+        self.set_info(album='' if data is None else data.decode('utf-8'))
+
+    def _on_artist(self, data):
+        self.set_info(artist='' if data is None else data.decode('utf-8'))
+
+    def _on_title(self, data):
+        self.set_info(title='' if data is None else data.decode('utf-8'))
+
+    def _on_play(self, data):
+        self.set_info(status=ClientInfo.STATUS_PLAYING)
+
+    def _on_stop(self, data):
+        self.set_info(status=ClientInfo.STATUS_STOPPED)
+
+    def _on_progress(self, data):
+        times = '' if data is None else data.decode('utf-8')
+        if times:
+            times = times.split('/')
+            times = [int(x) for x in times]
+
+            self.set_info(
+                duration=(times[2]-times[0])/44100,
+                position=(times[1]-times[0])/44100)
+
+    def _on_volume(self, data):
+        volumes = '' if data is None else data.decode('utf-8')
+        if volumes:
+            volumes = volumes.split(',')
+            volumes = [float(x) for x in volumes]
+            volume = translate(
+                volumes[1],
+                volumes[2], volumes[3],
+                0, 100)
+            self.set_info(volume=int(volume), muted=volume < 5)
 
     def play(self):
         try:
             if not self.is_playing():
                 self._fn_play()
-                self._client_info.status = ClientInfo.STATUS_PLAYING
+                self.set_info(status=ClientInfo.STATUS_PLAYING)
         except Exception:
             pass
 
@@ -140,7 +138,7 @@ class ClientAirplay(Client):
         try:
             if self.is_playing():
                 self._fn_pause()
-                self._client_info.status = ClientInfo.STATUS_STOPPED
+                self.set_info(status=ClientInfo.STATUS_STOPPED)
         except Exception:
             pass
 
@@ -157,7 +155,7 @@ class ClientAirplay(Client):
             pass
 
     def get_volume(self):
-        return self._client_info.volume
+        return self.get_info().volume
 
     def volume_down(self):
         try:
@@ -171,42 +169,64 @@ class ClientAirplay(Client):
         except Exception:
             pass
 
-    def update_event(self, event, pulse):
-        if event.facility != 'sink_input':
-            return
-        self._check_pulse(pulse)
+    def update_pulse(self, changes, mirror):
+        self._check_pulse(mirror)
 
-    def update(self):
-        cur_time = time.time()
-        if cur_time - self._last_update < self.UPDATE_INTERVAL:
-            return
+    def get_deadline(self):
+        # metadata wakes up the speaker, only progress needs a timer
+        if self.is_active() and self.is_playing():
+            return self._last_update + self.UPDATE_INTERVAL
+        return None
 
+    def update(self):
         self._update_info()
-        if self.is_active():
-            info = self.get_info()
-            if info.status == ClientInfo.STATUS_PLAYING:
-                info.position += cur_time - self._last_update
-                if info.position > info.duration:
-                    info.position = info.duration
+        # the sink input is checked on every update, the pulse wakeup for
+        # it may arrive right after an update caused by metadata
         active = self._sink_input is not None
         if active != self.is_active():
             self._active = active
             if active:
                 self._start_client()
+                # no progress to interpolate yet
+                self._last_update = time.time()
             else:
                 self._stop_client()
+        cur_time = time.time()
+        if cur_time - self._last_update < self.UPDATE_INTERVAL:
+            return
+
+        if self.is_active():
+            info = self.get_info()
+            if info.status == ClientInfo.STATUS_PLAYING:
+                self.set_info(position=min(
+                    info.position + cur_time - self._last_update,
+                    info.duration))
         self._last_update = cur_time
 
+    def get_fileno(self):
+        # raises OSError until shairport-sync created the pipe, the
+        # reader thread waits for it then
+        fileno = self._reader.fileno()
+        self._watched = True
+        return fileno
+
+    def on_readable(self):
+        self._reader.read()
+
+    def start(self):
+        self._reader.start(thread=not self._watched)
+
+    def stop(self):
+        self._reader.stop()
+        self.fifo.close()
+
     def _start_client(self):
-        self._client_info.album_art = None
-        self._client_info.album = ''
-        self._client_info.title = ''
-        self._client_info.artist = ''
-        self._client_info.position = -1
-        self._client_info.duration = -1
-        self.get_speaker().mixer.setvolume(100)
+        self.set_info(
+            album_art=None, album_art_id=None, album='', title='',
+            artist='', position=-1, duration=-1)
+        self.get_speaker().mixer.set_volume(100)
 
     def _stop_client(self):
         volume = self.get_volume()
         if volume:
-            self.get_speaker().mixer.setvolume(volume)
+            self.get_speaker().mixer.set_volume(volume)
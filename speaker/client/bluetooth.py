@@ -1,6 +1,11 @@
 import time
 import dbus
 
+from threading import Thread, Lock
+
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
+
 from ..draw import OverlayIconBluetooth, IconBluetooth
 
 from .client import Client, ClientInfo
@@ -8,28 +13,47 @@ from .client import Client, ClientInfo
 
 class BluetoothClientInfo(ClientInfo):
 
-    def __init__(self, res):
-        if not res:
-            return
-        self.status = (
-            ClientInfo.STATUS_PLAYING if res.get('Status') == 'playing'
-            else ClientInfo.STATUS_STOPPED)
-        self.position = int(res.get('Position')) / 1000
-        track = res.get('Track')
-        if track:
-            self.duration = int(track.get('Duration')) / 1000
-            self.artist = track.get('Artist', '')
-            self.title = track.get('Title', '')
-            self.album = track.get('Album', '')
+    __slots__ = ()
+
+    def __init__(self, res=None):
+        super().__init__(**self.get_fields(res))
+
+    @staticmethod
+    def get_fields(res):
+        '''
+        Returns info fields for the properties of a bluez media player
+        '''
+        res = res or {}
+        track = res.get('Track') or {}
+        fields = {
+            'status': (
+                ClientInfo.STATUS_PLAYING if res.get('Status') == 'playing'
+                else ClientInfo.STATUS_STOPPED),
+            'duration': (
+                int(track.get('Duration', 0)) / 1000 if track else -1),
+            'artist': str(track.get('Artist', '')),
+            'title': str(track.get('Title', '')),
+            'album': str(track.get('Album', '')),
+        }
+        if 'Position' in res:
+            fields['position'] = int(res.get('Position')) / 1000
+        return fields
 
 
 class ClientBluetooth(Client):
 
     '''
     Client for bluetooth connections
+
+    The player properties are cached and kept up to date from
+    PropertiesChanged signals, which are received on a private system
+    bus connection dispatched by a GLib main loop thread. get_info()
+    does not call D-Bus, while playing the position is interpolated
+    locally between signals and published on update().
     '''
 
     PRIORITY = 50
+    PULSE_FACILITIES = ('card',)
     OVERLAY = OverlayIconBluetooth
     ICON = IconBluetooth
     UPDATE_INTERVAL = 1
@@ -41,13 +65,79 @@ class ClientBluetooth(Client):
         self._player_iface = None
         self._transport_iface = None
         self._init_volume = None
+        self._bus = None
+        self._loop = None
+        self._loop_thread = None
+        self._signal = None
+        self._lock = Lock()
+        self._props = {}
+        self._info = BluetoothClientInfo()
+        self._position = -1
+        self._info_time = 0
+
+    def start(self):
+        self._bus = dbus.SystemBus(mainloop=DBusGMainLoop(), private=True)
+        self._loop = GLib.MainLoop()
+        self._loop_thread = Thread(target=self._loop.run, daemon=True)
+        self._loop_thread.start()
+        self.get_speaker().mixer.add_listener(self._on_mixer_changed)
+
+    def stop(self):
+        self.get_speaker().mixer.remove_listener(self._on_mixer_changed)
+        self._remove_signal()
+        if self._loop:
+            self._loop.quit()
+            self._loop_thread.join(timeout=1)
+            self._loop = None
+        if self._bus:
+            self._bus.close()
+            self._bus = None
+
+    def _remove_signal(self):
+        if self._signal:
+            self._signal.remove()
+            self._signal = None
+
+    def _on_properties_changed(self, interface, changed, invalidated):
+        if interface != 'org.bluez.MediaPlayer1':
+            return
+        self._set_props(changed, invalidated)
+
+    def _set_props(self, changed, invalidated=(), reset=False):
+        with self._lock:
+            props = {} if reset else dict(self._props)
+            props.update(changed)
+            for name in invalidated:
+                props.pop(name, None)
+            self._props = props
+            fields = BluetoothClientInfo.get_fields(props)
+            if reset:
+                fields.setdefault('position', -1)
+            elif 'Position' not in changed:
+                # carry over the interpolated position
+                fields['position'] = self._get_position()
+            self._position = fields.get('position', -1)
+            self._info_time = time.time()
+            self.set_info(**fields)
+        self.get_speaker().wakeup()
+
+    def _get_position(self):
+        info = self._info
+        position = self._position
+        if info.status == ClientInfo.STATUS_PLAYING and position >= 0:
+            position += time.time() - self._info_time
+            if info.duration > 0:
+                position = min(position, info.duration)
+        return position
 
     def _update_dbus(self, path):
         self._player_iface = None
         self._transport_iface = None
         self._path = None
+        self._remove_signal()
+        self._set_props({}, reset=True)
         try:
-            bus = dbus.SystemBus()
+            bus = self._bus or dbus.SystemBus()
             obj = bus.get_object(
                 'org.bluez', f'{path}/player0')
             self._player_iface = dbus.Interface(
@@ -55,6 +145,15 @@ class ClientBluetooth(Client):
             self._transport_iface = dbus.Interface(
                 obj, "org.freedesktop.DBus.Properties")
             self._path = path
+            self._signal = bus.add_signal_receiver(
+                self._on_properties_changed,
+                signal_name='PropertiesChanged',
+                dbus_interface='org.freedesktop.DBus.Properties',
+                bus_name='org.bluez',
+                path=f'{path}/player0')
+            # initial state, everything else arrives by signals
+            self._set_props(
+                self._transport_iface.GetAll('org.bluez.MediaPlayer1'))
         except Exception:
             pass
         if self._player_iface:
@@ -72,28 +171,16 @@ class ClientBluetooth(Client):
             self._fn_voldown = None
             self._fn_volup = None
 
-    def _check_pulse(self, pulse):
+    def _check_pulse(self, mirror):
         path = None
-        for c in pulse.card_list():
-            props = c.proplist
-            if props.get('device.api') == 'bluez':
-                path = props.get('bluez.path')
-                if path != self._path:
-                    break
+        for c in mirror.get_cards('bluez'):
+            path = c.proplist.get('bluez.path')
+            if path != self._path:
+                break
         if self._path != path:
             self._update_dbus(path)
             self._path = path
 
-    def get_info(self):
-        res = None
-        try:
-            res = self._transport_iface.GetAll("org.bluez.MediaPlayer1")
-        except Exception:
-            pass
-        info = BluetoothClientInfo(res)
-        info.volume = self.get_volume()
-        return info
-
     def play(self):
         try:
             self._fn_play()
@@ -132,27 +219,32 @@ class ClientBluetooth(Client):
         except Exception:
             pass
 
-    def update_event(self, event, pulse):
-        if event.facility != 'card':
-            return
-        self._check_pulse(pulse)
+    def _on_mixer_changed(self, volume, muted):
+        if self.is_active():
+            self.set_info(volume=volume)
+
+    def update_pulse(self, changes, mirror):
+        self._check_pulse(mirror)
+
+    def get_deadline(self):
+        # signals wake up the speaker, only progress needs a timer
+        if self.is_active() and self.is_playing():
+            return self._last_update + self.UPDATE_INTERVAL
+        return None
 
     def update(self):
+        # active while a media player is connected, set before the
+        # throttle so a wakeup by a signal is never delayed
+        self._active = self._player_iface is not None
+
         cur_time = time.time()
         if cur_time - self._last_update < self.UPDATE_INTERVAL:
             return
 
-        active = self._player_iface is not None
-        self._active = active
-        if active != self.is_active():
-            self._active = self._sink_input is not None
-            if self._active:
-                self._start_client()
-            else:
-                self._stop_client()
-
         if self.is_active():
-            info = self.get_info()
+            with self._lock:
+                position = self._get_position()
+            info = self.set_info(position=position, volume=self.get_volume())
             if info.status == ClientInfo.STATUS_PLAYING:
                 print("BT", info)
 
@@ -1,5 +1,9 @@
 import os
+import time
 import select
+import itertools
+
+from threading import Lock
 
 from ..draw import Icon, Overlay
 
@@ -20,6 +24,7 @@ class FIFO:
             self._create()
 
         self._f = None
+        self._w = None
         self._buf = ''
 
     def _create(self):
@@ -35,13 +40,25 @@ class FIFO:
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if self._f is not None:
-            os.close(self._f)
-            self._f = None
+        self.close()
 
-    def read(self):
+    def fileno(self):
         if self._f is None:
             self._f = os.open(self.fifo_name, os.O_RDONLY | os.O_NONBLOCK)
+            # keep a writer open, so the reader never sees EOF when
+            # the writing process restarts
+            self._w = os.open(self.fifo_name, os.O_WRONLY | os.O_NONBLOCK)
+        return self._f
+
+    def close(self):
+        for fd in (self._f, self._w):
+            if fd is not None:
+                os.close(fd)
+        self._f = None
+        self._w = None
+
+    def read(self):
+        self.fileno()
         fifos, _, _ = select.select([self._f], [], [], 0)
         if self._f in fifos:
             while True:
@@ -62,18 +79,87 @@ class FIFO:
 
 class ClientInfo:
 
+    '''
+    Immutable snapshot of the state of a client
+
+    Clients publish a new snapshot with replace() when something changes.
+    Every snapshot gets a new, increasing version, so comparing versions
+    is enough to know if anything changed. changed contains the field
+    groups that differ from the snapshot it was created from.
+    '''
+
     STATUS_STOPPED = 0
     STATUS_PLAYING = 1
 
-    volume = None
-    muted = False
-    position = -1
-    duration = -1
-    status = STATUS_STOPPED
-    artist = ''
-    title = ''
-    album = ''
-    album_art = None
+    METADATA = 'metadata'
+    TRANSPORT = 'transport'
+    VOLUME = 'volume'
+    ART = 'art'
+    GROUPS = frozenset((METADATA, TRANSPORT, VOLUME, ART))
+
+    FIELDS = {
+        'volume': (VOLUME, None),
+        'muted': (VOLUME, False),
+        'position': (TRANSPORT, -1),
+        'duration': (TRANSPORT, -1),
+        'status': (TRANSPORT, STATUS_STOPPED),
+        'artist': (METADATA, ''),
+        'title': (METADATA, ''),
+        'album': (METADATA, ''),
+        'album_art': (ART, None),
+        'album_art_id': (ART, None),
+    }
+
+    __slots__ = tuple(FIELDS) + ('version', 'base', 'changed')
+
+    _versions = itertools.count(1)
+
+    def __init__(self, **kwargs):
+        for name, (_, default) in self.FIELDS.items():
+            object.__setattr__(self, name, kwargs.pop(name, default))
+        if kwargs:
+            raise TypeError(f'unknown fields: {", ".join(kwargs)}')
+        object.__setattr__(self, 'version', next(self._versions))
+        object.__setattr__(self, 'base', None)
+        object.__setattr__(self, 'changed', self.GROUPS)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def replace(self, **kwargs):
+        '''
+        Returns a new snapshot with the given fields changed
+
+        Returns self if no value changed.
+        '''
+        changed = set()
+        for name, value in kwargs.items():
+            if getattr(self, name) != value:
+                changed.add(self.FIELDS[name][0])
+        if not changed:
+            return self
+        info = object.__new__(type(self))
+        for name in self.FIELDS:
+            object.__setattr__(
+                info, name, kwargs.get(name, getattr(self, name)))
+        object.__setattr__(info, 'version', next(self._versions))
+        object.__setattr__(info, 'base', self.version)
+        object.__setattr__(info, 'changed', frozenset(changed))
+        return info
+
+    def changed_since(self, other):
+        '''
+        Returns the field groups changed since the snapshot other
+        '''
+        if other is None:
+            return self.GROUPS
+        if other.version == self.version:
+            return frozenset()
+        if other.version == self.base:
+            return self.changed
+        return frozenset(
+            group for name, (group, _) in self.FIELDS.items()
+            if getattr(self, name) != getattr(other, name))
 
     def __str__(self) -> str:
         res = ''
@@ -101,12 +187,15 @@ class Client:
     '''
 
     PRIORITY = 100
+    PULSE_FACILITIES = ()
     OVERLAY = Overlay
     ICON = Icon
 
     def __init__(self, speaker):
         self._speaker = speaker
         self._active = False
+        self._info = ClientInfo()
+        self._info_lock = Lock()
 
     def get_speaker(self):
         return self._speaker
@@ -121,26 +210,27 @@ class Client:
         return False
 
     def get_info(self) -> ClientInfo:
-        return ClientInfo()
+        return self._info
+
+    def set_info(self, **kwargs):
+        '''
+        Publishes a new info snapshot with the given fields changed
+        '''
+        with self._info_lock:
+            self._info = self._info.replace(**kwargs)
+        return self._info
 
     def get_volume(self):
-        mixer = self.get_speaker().mixer
-        volume = mixer.getvolume()[0]
-        return volume
+        return self.get_speaker().mixer.get_volume()
 
     def set_volume(self, volume):
-        mixer = self.get_speaker().mixer
-        mixer.setvolume(volume)
+        self.get_speaker().mixer.set_volume(volume)
 
     def volume_down(self):
-        volume = min(100, self.get_volume()-10)
-        mixer = self.get_speaker().mixer
-        mixer.setvolume(volume)
+        self.set_volume(self.get_volume() - 10)
 
     def volume_up(self):
-        volume = min(100, self.get_volume()+10)
-        mixer = self.get_speaker().mixer
-        mixer.setvolume(volume)
+        self.set_volume(self.get_volume() + 10)
 
     def toggle_play(self):
         self.pause() if self.is_playing() else self.play()
@@ -166,7 +256,35 @@ class Client:
     def update(self):
         return
 
-    def update_event(self, event, pulse):
+    def get_deadline(self):
+        '''
+        Returns the time the client needs update() to be called next,
+        None if the client wakes up the speaker itself
+        '''
+        return None
+
+    def get_fileno(self):
+        '''
+        Returns a file descriptor to watch for incoming data or None
+
+        Called by the asyncio runtime before start(). A client returning
+        a descriptor leaves reading it to on_readable().
+        '''
+        return None
+
+    def on_readable(self):
+        '''
+        Called from an io thread when the descriptor of get_fileno() is
+        readable, the client wakes up the speaker for changes
+        '''
+        return
+
+    def update_pulse(self, changes, mirror):
+        '''
+        Called with the changes in PULSE_FACILITIES as (event, object)
+        tuples, the object is None if removed. changes is empty when the
+        client should check the current state. mirror is a PulseMirror.
+        '''
         return
 
     def start(self):
@@ -174,3 +292,70 @@ class Client:
 
     def stop(self):
         return
+
+
+class ClientPush(Client):
+
+    '''
+    Base for clients whose server pushes state to a background thread
+
+    The thread computes the info fields and merges them with
+    _add_pending(). update() publishes all changes since the last render
+    pass with a single set_info(). While playing the position is
+    interpolated locally from _position, reported at _position_time.
+    The thread wakes up the speaker, only progress needs a timer.
+    '''
+
+    UPDATE_INTERVAL = 1
+
+    def __init__(self, speaker):
+        super().__init__(speaker)
+        self._lock = Lock()
+        self._pending = None
+        self._pending_active = False
+        self._position = -1
+        self._position_time = 0
+        self._last_update = 0
+
+    def _add_pending(self, fields, active=None):
+        '''
+        Merges fields into the changes not yet published, also sets the
+        activity when given. Called with _lock held.
+        '''
+        self._pending = dict(self._pending or {}, **fields)
+        if active is not None:
+            self._pending_active = active
+
+    def update(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+            active = self._pending_active
+            position = (self._position, self._position_time)
+        info = self.get_info()
+        if pending is not None:
+            self._active = active
+            status = pending.get('status', info.status)
+            duration = pending.get('duration', info.duration)
+        else:
+            status, duration = info.status, info.duration
+        now = time.time()
+        playing = self._active and status == ClientInfo.STATUS_PLAYING
+        if pending is not None or (
+                playing and now - self._last_update >= self.UPDATE_INTERVAL):
+            self._last_update = now
+            self.set_info(**(pending or {}), position=self._get_position(
+                now, status, duration, *position))
+
+    def _get_position(self, now, status, duration, position, position_time):
+        if position < 0:
+            return -1
+        if status == ClientInfo.STATUS_PLAYING:
+            position += now - position_time
+        if duration and duration > 0:
+            position = min(position, duration)
+        return position
+
+    def get_deadline(self):
+        if self.is_active() and self.is_playing():
+            return self._last_update + self.UPDATE_INTERVAL
+        return None
@@ -0,0 +1,356 @@
+import os
+import time
+import queue
+import select
+import socket
+
+from threading import Thread
+
+from ..draw import OverlayIconMPD, IconMPD
+from .client import ClientPush, ClientInfo
+
+
+class MPDError(Exception):
+    pass
+
+
+class MPDConnection:
+
+    '''
+    Connection to MPD using the idle protocol
+
+    A background thread owns the socket. It waits in idle for changes
+    of IDLE_SUBSYSTEMS and calls on_change with the changed subsystems
+    and the connection, so the callback can run commands. Commands from
+    other threads are queued with send(): the thread leaves idle with
+    noidle and runs them, their changes are reported by the next idle.
+    After every (re)connect on_change is called with all subsystems.
+    '''
+
+    IDLE_SUBSYSTEMS = ('player', 'mixer', 'playlist', 'options')
+    RECONNECT_DELAY = 1
+    RECONNECT_DELAY_MAX = 30
+    READ_SIZE = 65536
+    BINARY_LIMIT = 65536
+
+    def __init__(self, host, port, on_change=None, on_disconnect=None):
+        self._host = host
+        self._port = port
+        self._on_change = on_change
+        self._on_disconnect = on_disconnect
+        self._sock = None
+        self._buf = bytearray()
+        self._commands = queue.SimpleQueue()
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._thread = Thread(target=self._thread_fn, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        os.write(self._wake_w, b'\0')
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1)
+
+    def send(self, *command):
+        '''
+        Queues a command, can be called from any thread
+        '''
+        self._commands.put(command)
+        os.write(self._wake_w, b'\0')
+
+    # protocol, only used by the connection thread
+
+    @staticmethod
+    def _quote(arg):
+        arg = str(arg).replace('\\', '\\\\').replace('"', '\\"')
+        return f'"{arg}"'
+
+    def _write(self, *lines):
+        self._sock.sendall(''.join(f'{line}\n' for line in lines).encode())
+
+    def _format(self, command):
+        name, *args = command
+        return ' '.join([name] + [self._quote(a) for a in args])
+
+    def _fill(self):
+        chunk = self._sock.recv(self.READ_SIZE)
+        if not chunk:
+            raise ConnectionResetError('closed by server')
+        self._buf += chunk
+
+    def _read_line(self):
+        while True:
+            end = self._buf.find(b'\n')
+            if end >= 0:
+                line = bytes(self._buf[:end]).decode('utf-8', 'replace')
+                del self._buf[:end + 1]
+                return line
+            self._fill()
+
+    def _read_bytes(self, size):
+        while len(self._buf) < size + 1:
+            self._fill()
+        data = bytes(self._buf[:size])
+        # binary data is followed by a newline
+        del self._buf[:size + 1]
+        return data
+
+    def _read_response(self, list_ok=False):
+        '''
+        Reads (key, value) pairs up to OK, a list of them per command
+        with list_ok
+        '''
+        res = [[]]
+        while True:
+            line = self._read_line()
+            if line == 'OK':
+                return res if list_ok else res[0]
+            if line == 'list_OK':
+                res.append([])
+            elif line.startswith('ACK '):
+                raise MPDError(line)
+            else:
+                key, _, value = line.partition(': ')
+                res[-1].append((key, value))
+                if key == 'binary':
+                    res[-1].append(('data', self._read_bytes(int(value))))
+
+    def command(self, *command):
+        self._write(self._format(command))
+        return self._read_response()
+
+    def command_list(self, *commands):
+        '''
+        Runs the commands pipelined in one round trip, returns a list of
+        responses
+        '''
+        self._write(
+            'command_list_ok_begin',
+            *(self._format(c) for c in commands),
+            'command_list_end')
+        return self._read_response(list_ok=True)[:len(commands)]
+
+    def read_picture(self, uri):
+        '''
+        Reads the embedded picture of uri in binary chunks, returns
+        None if there is none
+        '''
+        data = bytearray()
+        size = None
+        while size is None or len(data) < size:
+            res = dict(self.command('readpicture', uri, len(data)))
+            if 'size' not in res or not res.get('data'):
+                return None
+            size = int(res['size'])
+            data += res['data']
+        return bytes(data)
+
+    def _connect(self):
+        sock = socket.create_connection((self._host, self._port), timeout=5)
+        sock.settimeout(5)
+        self._sock = sock
+        self._buf = bytearray()
+        greeting = self._read_line()
+        if not greeting.startswith('OK MPD'):
+            raise ConnectionError(f'not a mpd server: {greeting!r}')
+        try:
+            # bigger chunks for readpicture, mpd >= 0.22.4
+            self.command('binarylimit', self.BINARY_LIMIT)
+        except MPDError:
+            pass
+
+    def _close(self):
+        sock, self._sock = self._sock, None
+        if sock:
+            sock.close()
+
+    def _thread_fn(self):
+        delay = self.RECONNECT_DELAY
+        while self._running:
+            try:
+                self._connect()
+            except OSError:
+                self._close()
+                end = time.time() + delay
+                while self._running and time.time() < end:
+                    time.sleep(0.5)
+                delay = min(delay * 2, self.RECONNECT_DELAY_MAX)
+                continue
+            delay = self.RECONNECT_DELAY
+            try:
+                self._changed(self.IDLE_SUBSYSTEMS)
+                self._idle_loop()
+            except (OSError, MPDError) as e:
+                print(f'mpd connection lost: {e}')
+            self._close()
+            if self._on_disconnect:
+                self._on_disconnect()
+
+    def _changed(self, subsystems):
+        if self._on_change:
+            self._on_change(subsystems, self)
+
+    def _run_commands(self):
+        while True:
+            try:
+                command = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.command(*command)
+            except MPDError as e:
+                print(f'mpd command failed: {e}')
+
+    def _idle_loop(self):
+        while self._running:
+            self._run_commands()
+            self._write('idle ' + ' '.join(self.IDLE_SUBSYSTEMS))
+            # wait for changes or for commands to send
+            noidle = False
+            while not self._buf:
+                fds, _, _ = select.select([self._sock, self._wake_r], [], [])
+                if self._wake_r in fds:
+                    os.read(self._wake_r, 64)
+                    if not noidle:
+                        self._write('noidle')
+                        noidle = True
+                if self._sock in fds:
+                    break
+            changed = [
+                value for key, value in self._read_response()
+                if key == 'changed']
+            if changed:
+                self._changed(changed)
+
+
+class ClientMPD(ClientPush):
+
+    '''
+    Client for MPD
+
+    Nothing is polled: the connection waits in idle for player, mixer,
+    playlist and options changes. On a change status and currentsong
+    are fetched in one command list, the embedded cover art is read
+    with readpicture when the song changed. Publishing and position
+    interpolation are done by ClientPush.
+
+    The client is active while MPD is playing or paused.
+    '''
+
+    PRIORITY = 125
+    OVERLAY = OverlayIconMPD
+    ICON = IconMPD
+    VOLUME_STEP = 10
+
+    def __init__(self, speaker, host='localhost', port=6600):
+        super().__init__(speaker)
+        self._connection = MPDConnection(
+            host, port, on_change=self._on_change,
+            on_disconnect=self._on_disconnect)
+        self._state = None
+        self._song_file = None
+
+    def start(self):
+        self._connection.start()
+
+    def stop(self):
+        self._connection.stop()
+
+    # connection thread
+
+    def _on_change(self, subsystems, connection):
+        status, song = connection.command_list(('status',), ('currentsong',))
+        status, song = dict(status), dict(song)
+        fields = self._get_fields(status, song)
+        song_file = song.get('file')
+        with self._lock:
+            self._position = float(status.get('elapsed', -1))
+            self._position_time = time.time()
+            self._state = status.get('state')
+            self._add_pending(
+                fields, active=self._state in ('play', 'pause'))
+            art_changed = song_file != self._song_file
+            self._song_file = song_file
+        self.get_speaker().wakeup()
+        if not art_changed:
+            return
+        # publish the metadata first, the picture may take a while
+        data = None
+        if song_file:
+            try:
+                data = connection.read_picture(song_file)
+            except MPDError:
+                data = None
+        album_art_id = None
+        if data:
+            album_art_id = self.get_speaker().get_art_cache().put(data)
+        with self._lock:
+            self._add_pending(
+                {'album_art': data, 'album_art_id': album_art_id})
+        self.get_speaker().wakeup()
+
+    def _get_fields(self, status, song):
+        volume = int(status.get('volume', -1))
+        duration = float(
+            status.get('duration') or song.get('duration') or -1)
+        title = song.get('Title') or song.get('Name')
+        if not title and song.get('file'):
+            title = os.path.splitext(os.path.basename(song['file']))[0]
+        return {
+            'artist': song.get('Artist', ''),
+            'title': title or '',
+            'album': song.get('Album', ''),
+            'volume': volume if volume >= 0 else None,
+            'duration': duration,
+            'status': (
+                ClientInfo.STATUS_PLAYING if status.get('state') == 'play'
+                else ClientInfo.STATUS_STOPPED)}
+
+    def _on_disconnect(self):
+        with self._lock:
+            self._state = None
+            self._song_file = None
+            self._add_pending(
+                {'album_art': None, 'album_art_id': None}, active=False)
+        self.get_speaker().wakeup()
+
+    # actions
+
+    def play(self):
+        self._connection.send('play')
+
+    def pause(self):
+        self._connection.send('pause', 1)
+
+    def toggle_play(self):
+        with self._lock:
+            state = self._state
+        if state == 'play':
+            self.pause()
+        elif state == 'pause':
+            self._connection.send('pause', 0)
+        else:
+            self.play()
+
+    def prev(self):
+        self._connection.send('previous')
+
+    def next(self):
+        self._connection.send('next')
+
+    def get_volume(self):
+        return self.get_info().volume or 0
+
+    def set_volume(self, volume):
+        self._connection.send('setvol', max(0, min(100, int(volume))))
+
+    def volume_down(self):
+        self.set_volume(self.get_volume() - self.VOLUME_STEP)
+
+    def volume_up(self):
+        self.set_volume(self.get_volume() + self.VOLUME_STEP)
@@ -0,0 +1,256 @@
+import os
+import re
+import time
+import queue
+import select
+import binascii
+
+from threading import Thread
+
+
+class MetadataItem:
+
+    '''
+    Represents a shairport-sync metadata item
+    '''
+
+    __slots__ = ('type', 'code', 'data')
+
+    def __init__(self, type, code, data=None):
+        self.type = type
+        self.code = code
+        self.data = data
+
+    def __repr__(self):
+        size = None if self.data is None else len(self.data)
+        return f'MetadataItem({self.type!r}, {self.code!r}, {size})'
+
+
+class Base64Decoder:
+
+    '''
+    Streaming base64 decoder ignoring whitespace
+    '''
+
+    WHITESPACE = re.compile(rb'\s+')
+
+    def __init__(self):
+        self._rest = b''
+        self._data = bytearray()
+
+    def feed(self, chunk):
+        chunk = self._rest + self.WHITESPACE.sub(b'', chunk)
+        end = len(chunk) - len(chunk) % 4
+        self._rest = chunk[end:]
+        if end:
+            self._data += binascii.a2b_base64(chunk[:end])
+
+    def finish(self):
+        if self._rest:
+            self._data += binascii.a2b_base64(self._rest + b'==')
+            self._rest = b''
+        return bytes(self._data)
+
+
+class MetadataParser:
+
+    '''
+    Incremental parser for the shairport-sync metadata stream
+
+    Bytes are fed as they arrive and completed items are returned. Only
+    items accepted by the accept function get their data decoded, the
+    data of all other items is skipped without decoding.
+    '''
+
+    ITEM_START = b'<item>'
+    ITEM_END = b'</item>'
+    DATA_START = b'<data encoding="base64">'
+    DATA_END = b'</data>'
+    HEADER = re.compile(
+        rb'<type>([0-9a-fA-F]+)</type>\s*<code>([0-9a-fA-F]+)</code>')
+
+    STATE_ITEM = 0
+    STATE_DATA = 1
+    STATE_END = 2
+
+    def __init__(self, accept=None):
+        self._accept = accept
+        self._buf = bytearray()
+        self._state = self.STATE_ITEM
+        self._item = None
+        self._decoder = None
+
+    def feed(self, chunk):
+        self._buf += chunk
+        items = []
+        while True:
+            if self._state == self.STATE_ITEM:
+                res = self._parse_header()
+            elif self._state == self.STATE_DATA:
+                res = self._parse_data()
+            else:
+                res = self._parse_end()
+            if res is None:
+                break
+            if res is not True:
+                items.append(res)
+        return items
+
+    def _parse_header(self):
+        start = self._buf.find(self.ITEM_START)
+        if start < 0:
+            # keep a possible partial start tag
+            del self._buf[:max(0, len(self._buf) - len(self.ITEM_START))]
+            return None
+        end = self._buf.find(self.ITEM_END, start)
+        data = self._buf.find(self.DATA_START, start)
+        if data >= 0 and (end < 0 or data < end):
+            header_end = data
+        elif end >= 0:
+            header_end = end
+        else:
+            return None
+        match = self.HEADER.search(self._buf, start, header_end)
+        if not match:
+            # broken item, skip it
+            del self._buf[:start + len(self.ITEM_START)]
+            return True
+        dtype, dcode = (
+            bytes.fromhex(x.decode('ascii')).decode('ascii', 'replace')
+            for x in match.groups())
+        self._item = MetadataItem(dtype, dcode)
+        accepted = not self._accept or self._accept(dtype, dcode)
+        if header_end == data:
+            self._decoder = Base64Decoder() if accepted else None
+            self._state = self.STATE_DATA
+            del self._buf[:data + len(self.DATA_START)]
+            if not accepted:
+                self._item = None
+            return True
+        del self._buf[:end + len(self.ITEM_END)]
+        return self._item if accepted else True
+
+    def _parse_data(self):
+        end = self._buf.find(self.DATA_END)
+        if end < 0:
+            # decode what we have, keep a possible partial end tag
+            size = max(0, len(self._buf) - len(self.DATA_END) + 1)
+            if self._decoder is not None:
+                self._decoder.feed(bytes(self._buf[:size]))
+            del self._buf[:size]
+            return None
+        if self._decoder is not None:
+            self._decoder.feed(bytes(self._buf[:end]))
+            self._item.data = self._decoder.finish()
+            self._decoder = None
+        del self._buf[:end + len(self.DATA_END)]
+        self._state = self.STATE_END
+        return True
+
+    def _parse_end(self):
+        end = self._buf.find(self.ITEM_END)
+        if end < 0:
+            return None
+        del self._buf[:end + len(self.ITEM_END)]
+        self._state = self.STATE_ITEM
+        item, self._item = self._item, None
+        return item if item is not None else True
+
+
+class MetadataReader:
+
+    '''
+    Reads the shairport-sync metadata pipe in a background thread
+
+    Large non-blocking reads are fed to a MetadataParser. Items with a
+    (type, code) in handlers are put into a bounded queue as
+    (handler, data) and callback is called, everything else is dropped.
+    With prepare, data is replaced by prepare(handler, data) before it
+    is queued, so expensive work runs on the reader thread.
+
+    With start(thread=False) no thread is started, the owner watches
+    fileno() itself and calls read() when it is readable.
+    '''
+
+    READ_SIZE = 65536
+    QUEUE_SIZE = 64
+
+    def __init__(self, fifo, handlers, callback=None, prepare=None):
+        self._fifo = fifo
+        self._handlers = handlers
+        self._callback = callback
+        self._prepare = prepare
+        self._parser = MetadataParser(accept=self._accept)
+        self._queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._thread = None
+        self._running = False
+
+    def start(self, thread=True):
+        self._running = True
+        if thread:
+            self._thread = Thread(target=self._thread_fn, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1)
+
+    def fileno(self):
+        '''
+        Returns the pipe descriptor, raises OSError if it does not exist
+        '''
+        return self._fifo.fileno()
+
+    def read(self):
+        '''
+        Reads and queues the available data without blocking
+        '''
+        try:
+            chunk = os.read(self._fifo.fileno(), self.READ_SIZE)
+        except BlockingIOError:
+            return
+        items = self._parser.feed(chunk)
+        for item in items:
+            self._put(item)
+        if items and self._callback:
+            self._callback()
+
+    def get(self):
+        '''
+        Returns all queued (handler, data) tuples without blocking
+        '''
+        res = []
+        while True:
+            try:
+                res.append(self._queue.get_nowait())
+            except queue.Empty:
+                return res
+
+    def _accept(self, dtype, dcode):
+        return (dtype, dcode) in self._handlers
+
+    def _put(self, item):
+        handler = self._handlers[(item.type, item.code)]
+        data = item.data
+        if self._prepare:
+            data = self._prepare(handler, data)
+        entry = (handler, data)
+        while self._running:
+            try:
+                self._queue.put(entry, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _thread_fn(self):
+        while self._running:
+            try:
+                fd = self._fifo.fileno()
+            except OSError:
+                # pipe not created yet
+                time.sleep(1)
+                continue
+            fds, _, _ = select.select([fd], [], [], 0.5)
+            if fds:
+                self.read()
@@ -0,0 +1,444 @@
+import json
+import time
+import base64
+import select
+import socket
+import urllib.request
+
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from ..draw import OverlayIconSnapcast, IconSnapcast
+from .client import ClientPush, ClientInfo
+
+
+class SnapcastConnection:
+
+    '''
+    Persistent JSON-RPC connection to snapserver
+
+    Messages are newline delimited JSON over TCP. A background thread
+    keeps the connection open, reconnects with a growing delay and
+    passes notifications to on_notification. Responses are passed to
+    the callback given to request(). on_connect and on_disconnect are
+    called from the thread after every (re)connect and disconnect.
+    '''
+
+    RECONNECT_DELAY = 1
+    RECONNECT_DELAY_MAX = 30
+    READ_SIZE = 65536
+
+    def __init__(
+            self, host, port, on_connect=None, on_disconnect=None,
+            on_notification=None):
+        self._host = host
+        self._port = port
+        self._on_connect = on_connect
+        self._on_disconnect = on_disconnect
+        self._on_notification = on_notification
+        self._sock = None
+        self._send_lock = Lock()
+        self._callbacks = {}
+        self._next_id = 1
+        self._thread = None
+        self._running = False
+
+    def is_connected(self):
+        return self._sock is not None
+
+    def start(self):
+        self._running = True
+        self._thread = Thread(target=self._thread_fn, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1)
+
+    def request(self, method, params=None, callback=None):
+        '''
+        Sends a request, returns False if not connected
+
+        callback is called with the result or None on error.
+        '''
+        with self._send_lock:
+            if self._sock is None:
+                return False
+            request_id = self._next_id
+            self._next_id += 1
+            if callback:
+                self._callbacks[request_id] = callback
+            msg = {'id': request_id, 'jsonrpc': '2.0', 'method': method}
+            if params is not None:
+                msg['params'] = params
+            try:
+                self._sock.sendall(json.dumps(msg).encode() + b'\r\n')
+            except OSError:
+                self._callbacks.pop(request_id, None)
+                return False
+        return True
+
+    def _connect(self):
+        sock = socket.create_connection((self._host, self._port), timeout=5)
+        sock.setblocking(False)
+        with self._send_lock:
+            self._sock = sock
+            self._callbacks = {}
+
+    def _close(self):
+        with self._send_lock:
+            sock, self._sock = self._sock, None
+            self._callbacks = {}
+        if sock:
+            sock.close()
+
+    def _thread_fn(self):
+        delay = self.RECONNECT_DELAY
+        while self._running:
+            try:
+                self._connect()
+            except OSError:
+                end = time.time() + delay
+                while self._running and time.time() < end:
+                    time.sleep(0.5)
+                delay = min(delay * 2, self.RECONNECT_DELAY_MAX)
+                continue
+            delay = self.RECONNECT_DELAY
+            if self._on_connect:
+                self._on_connect()
+            try:
+                self._read_loop()
+            except OSError as e:
+                print(f'snapcast connection lost: {e}')
+            self._close()
+            if self._on_disconnect:
+                self._on_disconnect()
+
+    def _read_loop(self):
+        buf = b''
+        while self._running:
+            fds, _, _ = select.select([self._sock], [], [], 0.5)
+            if not fds:
+                continue
+            chunk = self._sock.recv(self.READ_SIZE)
+            if not chunk:
+                raise ConnectionResetError('closed by server')
+            buf += chunk
+            *lines, buf = buf.split(b'\n')
+            for line in lines:
+                if line.strip():
+                    self._handle_line(line)
+
+    def _handle_line(self, line):
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            print(f'snapcast: invalid message {line[:80]!r}')
+            return
+        # batches arrive as lists
+        for m in msg if isinstance(msg, list) else [msg]:
+            if 'id' in m and m['id'] is not None:
+                with self._send_lock:
+                    callback = self._callbacks.pop(m['id'], None)
+                if callback:
+                    callback(m.get('result'))
+            elif 'method' in m and self._on_notification:
+                self._on_notification(m['method'], m.get('params', {}))
+
+
+class ClientSnapcast(ClientPush):
+
+    '''
+    Client for a snapclient running on the speaker
+
+    The server state is pushed by snapserver notifications over one
+    persistent connection, nothing is polled. The connection thread
+    only updates the server state and computes the resulting info
+    fields, publishing and position interpolation are done by
+    ClientPush.
+
+    The snapclient is found by client_id or else by the host name of
+    the speaker. The client is active while the stream of its group is
+    playing.
+    '''
+
+    PRIORITY = 150
+    OVERLAY = OverlayIconSnapcast
+    ICON = IconSnapcast
+    VOLUME_STEP = 10
+
+    def __init__(self, speaker, host='localhost', port=1705, client_id=None):
+        super().__init__(speaker)
+        self._connection = SnapcastConnection(
+            host, port, on_connect=self._on_connect,
+            on_disconnect=self._on_disconnect,
+            on_notification=self._on_notification)
+        self._client_id = client_id
+        self._hostname = socket.gethostname()
+        self._clients = {}
+        self._groups = {}
+        self._streams = {}
+        self._properties_time = {}
+        self._art = None
+        self._art_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='snapcast-art')
+        self._handlers = {
+            'Server.OnUpdate': self._on_server_update,
+            'Client.OnConnect': self._on_client_update,
+            'Client.OnDisconnect': self._on_client_update,
+            'Client.OnVolumeChanged': self._on_client_volume,
+            'Group.OnMute': self._on_group_mute,
+            'Group.OnStreamChanged': self._on_group_stream,
+            'Stream.OnUpdate': self._on_stream_update,
+            'Stream.OnProperties': self._on_stream_properties,
+        }
+
+    def start(self):
+        self._connection.start()
+
+    def stop(self):
+        self._connection.stop()
+        self._art_executor.shutdown(wait=False)
+
+    # connection thread
+
+    def _on_connect(self):
+        self._connection.request(
+            'Server.GetStatus', callback=self._on_server_update)
+
+    def _on_disconnect(self):
+        with self._lock:
+            self._clients = {}
+            self._groups = {}
+            self._streams = {}
+        self._changed()
+
+    def _on_notification(self, method, params):
+        handler = self._handlers.get(method)
+        if handler:
+            handler(params)
+
+    def _on_server_update(self, result):
+        if not result:
+            return
+        server = result.get('server', result)
+        with self._lock:
+            self._clients = {}
+            self._groups = {}
+            for group in server.get('groups', []):
+                self._set_group(group)
+            self._streams = {
+                s['id']: s for s in server.get('streams', [])}
+            self._properties_time = dict.fromkeys(
+                self._streams, time.time())
+        self._changed()
+
+    def _set_group(self, group):
+        self._groups[group['id']] = {
+            'stream_id': group.get('stream_id'),
+            'muted': group.get('muted', False),
+            'clients': [c['id'] for c in group.get('clients', [])]}
+        for c in group.get('clients', []):
+            self._clients[c['id']] = c
+
+    def _on_client_update(self, params):
+        client = params.get('client')
+        with self._lock:
+            if client and params['id'] in self._clients:
+                self._clients[params['id']] = client
+        self._changed()
+
+    def _on_client_volume(self, params):
+        with self._lock:
+            client = self._clients.get(params['id'])
+            if client:
+                client.setdefault('config', {})['volume'] = params['volume']
+        self._changed()
+
+    def _on_group_mute(self, params):
+        with self._lock:
+            group = self._groups.get(params['id'])
+            if group:
+                group['muted'] = params.get('mute', False)
+        self._changed()
+
+    def _on_group_stream(self, params):
+        with self._lock:
+            group = self._groups.get(params['id'])
+            if group:
+                group['stream_id'] = params.get('stream_id')
+        self._changed()
+
+    def _on_stream_update(self, params):
+        stream = params.get('stream')
+        if stream:
+            with self._lock:
+                self._streams[params['id']] = stream
+                self._properties_time[params['id']] = time.time()
+        self._changed()
+
+    def _on_stream_properties(self, params):
+        with self._lock:
+            stream = self._streams.get(params['id'])
+            if stream is not None:
+                stream['properties'] = params.get('properties', {})
+                self._properties_time[params['id']] = time.time()
+        self._changed()
+
+    def _find_client(self):
+        if self._client_id:
+            return self._clients.get(self._client_id)
+        for c in self._clients.values():
+            if c.get('host', {}).get('name') == self._hostname:
+                return c
+        return None
+
+    def _find_stream(self, client):
+        for group in self._groups.values():
+            if client['id'] in group['clients']:
+                return group, self._streams.get(group['stream_id'])
+        return None, None
+
+    def _changed(self):
+        '''
+        Computes the info fields from the server state
+        '''
+        with self._lock:
+            client = self._find_client()
+            group, stream = (
+                self._find_stream(client) if client else (None, None))
+            if not client or not stream:
+                self._add_pending({}, active=False)
+            else:
+                fields, art = self._get_fields(client, group, stream)
+                self._add_pending(fields, active=(
+                    client.get('connected', True)
+                    and stream.get('status') == 'playing'))
+                self._pending_art(art)
+        self.get_speaker().wakeup()
+
+    def _get_fields(self, client, group, stream):
+        volume = client.get('config', {}).get('volume', {})
+        props = stream.get('properties') or {}
+        meta = props.get('metadata') or {}
+        artist = meta.get('artist', '')
+        if isinstance(artist, list):
+            artist = ', '.join(artist)
+        playing = props.get('playbackStatus', stream.get('status'))
+        fields = {
+            'artist': artist,
+            'title': meta.get('title', ''),
+            'album': meta.get('album', ''),
+            'volume': volume.get('percent'),
+            'muted': volume.get('muted', False) or group['muted'],
+            'duration': meta.get('duration', -1),
+            'status': (
+                ClientInfo.STATUS_PLAYING if playing == 'playing'
+                else ClientInfo.STATUS_STOPPED)}
+        if 'position' in props:
+            # the position is only as new as the properties, not this
+            # notification
+            self._position = props['position']
+            self._position_time = self._properties_time.get(
+                stream['id'], time.time())
+        art_data = meta.get('artData')
+        if art_data and art_data.get('data'):
+            art = ('data', art_data['data'])
+        elif meta.get('artUrl'):
+            art = ('url', meta['artUrl'])
+        else:
+            art = None
+        return fields, art
+
+    def _pending_art(self, art):
+        # the art only changes with the track, not on every notification
+        if art == self._art:
+            return
+        self._art = art
+        if art is None:
+            self._add_pending({'album_art': None, 'album_art_id': None})
+        else:
+            # decoding, downloading and caching are done off the lock
+            self._art_executor.submit(self._fetch_art, art)
+
+    def _fetch_art(self, art):
+        try:
+            if art[0] == 'data':
+                data = base64.b64decode(art[1])
+            else:
+                with urllib.request.urlopen(art[1], timeout=5) as res:
+                    data = res.read()
+        except (OSError, ValueError) as e:
+            print(f'snapcast album art failed: {e}')
+            return
+        album_art_id = self.get_speaker().get_art_cache().put(data)
+        with self._lock:
+            if art != self._art:
+                return
+            self._add_pending(
+                {'album_art': data, 'album_art_id': album_art_id})
+        self.get_speaker().wakeup()
+
+    # actions
+
+    def _get_ids(self):
+        with self._lock:
+            client = self._find_client()
+            if not client:
+                return None, None
+            _, stream = self._find_stream(client)
+            return client['id'], stream['id'] if stream else None
+
+    def _control(self, command):
+        _, stream_id = self._get_ids()
+        if stream_id:
+            self._connection.request(
+                'Stream.Control', {'id': stream_id, 'command': command})
+
+    def play(self):
+        self._control('play')
+
+    def pause(self):
+        self._control('pause')
+
+    def toggle_play(self):
+        self._control('playPause')
+
+    def prev(self):
+        self._control('previous')
+
+    def next(self):
+        self._control('next')
+
+    def get_volume(self):
+        return self.get_info().volume or 0
+
+    def _set_client_volume(self, percent=None, muted=None):
+        client_id, _ = self._get_ids()
+        if not client_id:
+            return
+        info = self.get_info()
+        volume = {
+            'percent': info.volume if percent is None else percent,
+            'muted': info.muted if muted is None else muted}
+        # snapserver does not notify the client that made the change
+        self._connection.request(
+            'Client.SetVolume', {'id': client_id, 'volume': volume},
+            callback=lambda result: result and self._on_client_volume(
+                {'id': client_id, 'volume': result['volume']}))
+
+    def set_volume(self, volume):
+        self._set_client_volume(percent=max(0, min(100, int(volume))))
+
+    def volume_down(self):
+        self.set_volume(self.get_volume() - self.VOLUME_STEP)
+
+    def volume_up(self):
+        self.set_volume(self.get_volume() + self.VOLUME_STEP)
+
+    def mute(self):
+        self._set_client_volume(muted=True)
+
+    def unmute(self):
+        self._set_client_volume(muted=False)
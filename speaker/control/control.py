@@ -1,11 +1,38 @@
+import time
+import queue
+
+
+class Command:
+
+    '''
+    Input command with the time of the input event
+    '''
+
+    __slots__ = ('name', 'timestamp')
+
+    def __init__(self, name, timestamp=None):
+        self.name = name
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def __repr__(self):
+        return f'Command({self.name!r}, {self.timestamp})'
+
+
 class Control:
 
     '''
     Represents controls
+
+    Input events arrive on their own threads. They are turned into
+    commands with post(), which only queues them and wakes up the
+    speaker. The render loop calls process() to handle the queued
+    commands with handle_command(), so the display and clients are only
+    changed by the render loop.
     '''
 
     def __init__(self, speaker):
         self._speaker = speaker
+        self._commands = queue.SimpleQueue()
 
     def get_speaker(self):
         return self._speaker
@@ -15,3 +42,32 @@ class Control:
 
     def stop(self):
         return
+
+    def post(self, name, timestamp=None):
+        '''
+        Queues a command, can be called from any thread
+        '''
+        self._commands.put(Command(name, timestamp))
+        self._speaker.wakeup()
+
+    def process(self):
+        '''
+        Handles the queued commands, called by the render loop
+
+        If a command shows feedback, the latency from the input event to
+        the next frame written to the display is recorded.
+        '''
+        display = self._speaker.display
+        while True:
+            try:
+                command = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            if self.handle_command(command):
+                display.add_input(command.timestamp)
+
+    def handle_command(self, command):
+        '''
+        Handles a command, returns True if it changed the display
+        '''
+        return False
@@ -11,16 +11,30 @@ from .control import Control
 
 class ControlPirateAudio(Control):
 
+    '''
+    Buttons of the Pirate Audio boards
+
+    The gpio callback only debounces the button and posts a command,
+    the overlays are set by the render loop and the client actions run
+    in the action thread of the speaker.
+    '''
+
+    PLAY = 'play'
+    NEXT = 'next'
+    VOLUME_DOWN = 'volume_down'
+    VOLUME_UP = 'volume_up'
+
     def __init__(
             self, speaker, pin_play=6, pin_next=24,
             pin_volume_down=5, pin_volume_up=16):
         super().__init__(speaker)
         self._pins = [pin_play, pin_next, pin_volume_down, pin_volume_up]
         self._last_press = 0
-        self._pin_play = pin_play
-        self._pin_next = pin_next
-        self._pin_volume_down = pin_volume_down
-        self._pin_volume_up = pin_volume_up
+        self._commands_by_pin = {
+            pin_play: self.PLAY,
+            pin_next: self.NEXT,
+            pin_volume_down: self.VOLUME_DOWN,
+            pin_volume_up: self.VOLUME_UP}
 
     def start(self):
         GPIO.setup(self._pins, GPIO.IN, pull_up_down=GPIO.PUD_UP)
@@ -37,11 +51,24 @@ class ControlPirateAudio(Control):
         if self._last_press + 0.5 > now:
             return
         self._last_press = now
+        name = self._commands_by_pin.get(pin)
+        if name:
+            self.post(name, now)
+
+    def _show_button(self, overlay):
+        self.get_speaker().display.set_overlay(
+            overlay,
+            duration=1.0,
+            fade_duration=0.5,
+            opacity=0.9,
+            fade_out=True)
+
+    def handle_command(self, command):
         speaker = self.get_speaker()
         active = speaker.is_active()
         speaker.set_active()
         if not active:
-            return
+            return False
         client = speaker.client
         if not client:
             speaker.display.set_overlay(
@@ -51,44 +78,22 @@ class ControlPirateAudio(Control):
                 opacity=0.9,
                 foreground='#c00',
                 fade_out=True)
-            return
-        if pin == self._pin_play:
+            return True
+        if command.name == self.PLAY:
             if client.is_playing():
-                speaker.display.set_overlay(
-                    OverlayButtonPause,
-                    duration=1.0,
-                    fade_duration=0.5,
-                    opacity=0.9,
-                    fade_out=True)
+                self._show_button(OverlayButtonPause)
             else:
-                speaker.display.set_overlay(
-                    OverlayButtonPlay,
-                    duration=1.0,
-                    fade_duration=0.5,
-                    opacity=0.9,
-                    fade_out=True)
-            client.toggle_play()
-        elif pin == self._pin_next:
-            speaker.display.set_overlay(
-                OverlayButtonNext,
-                duration=1.0,
-                fade_duration=0.5,
-                opacity=0.9,
-                fade_out=True)
-            client.next()
-        elif pin == self._pin_volume_down:
-            speaker.display.set_overlay(
-                OverlayButtonVolumeDown,
-                duration=1.0,
-                fade_duration=0.5,
-                opacity=0.9,
-                fade_out=True)
-            client.volume_down()
-        elif pin == self._pin_volume_up:
-            speaker.display.set_overlay(
-                OverlayButtonVolumeUp,
-                duration=1.0,
-                fade_duration=0.5,
-                opacity=0.9,
-                fade_out=True)
-            client.volume_up()
+                self._show_button(OverlayButtonPlay)
+            speaker.call_action(client.toggle_play)
+        elif command.name == self.NEXT:
+            self._show_button(OverlayButtonNext)
+            speaker.call_action(client.next)
+        elif command.name == self.VOLUME_DOWN:
+            self._show_button(OverlayButtonVolumeDown)
+            speaker.call_action(client.volume_down)
+        elif command.name == self.VOLUME_UP:
+            self._show_button(OverlayButtonVolumeUp)
+            speaker.call_action(client.volume_up)
+        else:
+            return False
+        return True
@@ -1,2 +1,4 @@
 from .st7789 import DisplayST7789
 from .tk import DisplayTK
+from .headless import DisplayHeadless
+from .recorder import DisplayRecorder
@@ -1,21 +1,72 @@
-from PIL import Image
+import time
+
+from threading import Lock
+
+from PIL import Image, ImageDraw
+
+from ..pacing import FrameScheduler
+from ..stats import RollingStats
+from .fade import OverlayFade
+from .flush import DisplayFlush
 
 
 class Display:
 
     '''
     Represents a display
+
+    The display keeps track of damaged regions. Scenes and overlays
+    report dirty rects, the display hashes the tiles covered by them and
+    only tiles whose content changed since the last update are marked
+    dirty. pop_damage() returns the dirty tiles merged into windows.
+
+    Backends implement _write(image, damage). With async_flush the
+    writes are done by a DisplayFlush worker, if the backend allows
+    writing from another thread.
+
+    Overlays are blended by OverlayFade, which quantizes the opacity to
+    FADE_STEPS and caches the blended frames.
+
+    The scene and the overlay are only updated on the deadlines of their
+    pacing, kept by a FrameScheduler.
+
+    With stats set, scene updates are timed per scene class and the HUD
+    shows fps, frame times and cpu usage on top of the frame.
+
+    Input events marked with add_input() are passed along with the next
+    written frame, the latency from the event to the end of the write
+    is kept for get_input_latency().
     '''
 
     WIDTH = 0
     HEIGHT = 0
+    TILE_SIZE = 40
+    THREADED_FLUSH = True
+    FADE_STEPS = 32
+    HUD_INTERVAL = 0.5
+    HUD_HEIGHT = 28
 
-    def __init__(self, speaker):
+    def __init__(self, speaker, async_flush=False):
         self._image = Image.new('RGBA', self.get_size(), (255, 255, 255))
         self._speaker = speaker
         self._brightness = 0
         self._scene = None
         self._overlay = None
+        self._tiles = {}
+        self._dirty = set()
+        self._flush = None
+        self._fade = OverlayFade(steps=self.FADE_STEPS)
+        self._frame = None
+        self._scheduler = FrameScheduler()
+        self._stats = None
+        self._hud = False
+        self._hud_base = None
+        self._hud_time = 0
+        self._inputs = []
+        self._input_latency = RollingStats()
+        self._input_lock = Lock()
+        if async_flush and self.THREADED_FLUSH:
+            self._flush = DisplayFlush(self)
 
     def get_speaker(self):
         return self._speaker
@@ -35,6 +86,28 @@ class Display:
 
     def set_overlay(self, overlay, *args, **kargs):
         self._overlay = overlay(self, *args, **kargs) if overlay else None
+        self._fade.clear()
+        self._speaker.wakeup()
+
+    def set_stats(self, stats, hud=False):
+        self._stats = stats
+        self._hud = hud and stats is not None
+
+    def get_bytes_written(self):
+        return 0
+
+    def add_input(self, timestamp):
+        '''
+        Marks an input event shown by the next frame written
+        '''
+        self._inputs.append(timestamp)
+
+    def get_input_latency(self):
+        '''
+        Returns a summary of the input to frame latency in seconds
+        '''
+        with self._input_lock:
+            return self._input_latency.get_summary()
 
     def get_brightness(self):
         return self._brightness
@@ -42,37 +115,194 @@ class Display:
     def set_brightness(self, brightness):
         self._brightness = brightness
 
+    def _get_sources(self):
+        scene = self.get_scene()
+        overlay = self.get_overlay()
+        sources = []
+        if scene:
+            sources.append(('scene', scene))
+            if overlay and scene.use_overlay():
+                sources.append(('overlay', overlay))
+        return sources
+
+    def get_deadline(self):
+        '''
+        Returns the time the scene or overlay needs the next update
+        '''
+        now = time.time()
+        deadlines = []
+        for slot, source in self._get_sources():
+            deadlines.append(source.get_deadline())
+            deadlines.append(self._scheduler.get_deadline(
+                slot, source, source.get_pacing(), now))
+        if self._hud:
+            deadlines.append(self._hud_time + self.HUD_INTERVAL)
+        deadlines = [d for d in deadlines if d is not None]
+        return min(deadlines) if deadlines else None
+
+    def get_frame_stats(self):
+        return self._scheduler.get_stats()
+
+    def _record_frame(self, slot, source, now):
+        self._scheduler.frame(slot, source, source.get_pacing(), now)
+
+    def add_damage(self, rect=None):
+        '''
+        Checks the tiles covered by rect and marks changed tiles dirty
+        '''
+        width, height = self.get_size()
+        if rect is None:
+            rect = (0, 0, width, height)
+        x0, y0, x1, y1 = rect
+        ts = self.TILE_SIZE
+        for ty in range(max(0, y0) // ts, (min(y1, height) - 1) // ts + 1):
+            for tx in range(max(0, x0) // ts, (min(x1, width) - 1) // ts + 1):
+                box = (tx * ts, ty * ts,
+                       min((tx + 1) * ts, width), min((ty + 1) * ts, height))
+                tile_hash = hash(self._image.crop(box).tobytes())
+                if self._tiles.get((tx, ty)) != tile_hash:
+                    self._tiles[(tx, ty)] = tile_hash
+                    self._dirty.add((tx, ty))
+
+    def pop_damage(self):
+        '''
+        Returns dirty tiles merged into a list of windows (x0, y0, x1, y1)
+        '''
+        width, height = self.get_size()
+        ts = self.TILE_SIZE
+        windows = []
+        open_windows = {}
+        for ty in range(0, (height - 1) // ts + 1):
+            # merge runs of dirty tiles in this row
+            runs, start = [], None
+            for tx in range(0, (width - 1) // ts + 2):
+                if (tx, ty) in self._dirty:
+                    if start is None:
+                        start = tx
+                elif start is not None:
+                    runs.append((start, tx))
+                    start = None
+            # extend windows of the previous row with the same span
+            next_windows = {}
+            for run in runs:
+                window = open_windows.pop(run, None)
+                if window is None:
+                    window = [run[0] * ts, ty * ts, run[1] * ts, 0]
+                    windows.append(window)
+                window[3] = (ty + 1) * ts
+                next_windows[run] = window
+            open_windows = next_windows
+        self._dirty.clear()
+        return [(x0, y0, min(x1, width), min(y1, height))
+                for x0, y0, x1, y1 in windows]
+
     def update(self):
         scene_update = False
         overlay_update = False
+        damage = []
         scene = self.get_scene()
         overlay = self.get_overlay()
+        now = time.time()
         if overlay and scene and scene.use_overlay():
+            self._record_frame('overlay', overlay, now)
             if overlay.update():
                 overlay_update = True
+                damage += overlay.pop_damage() or [None]
             if not overlay.is_active():
                 self.set_overlay(None)
                 overlay = None
                 overlay_update = True
+                damage.append(None)
+        scene_changed = False
         if scene:
-            if overlay_update or scene.update():
+            if not overlay_update:
+                self._record_frame('scene', scene, now)
+                scene_changed = self._update_scene(scene)
+            if overlay_update or scene_changed:
                 scene_image = scene.get_image()
                 if scene_image:
                     self._image = scene_image
                 scene_update = True
+                damage += scene.pop_damage() or [None]
         if (overlay and scene and scene.use_overlay()
                 and (overlay_update or scene_update)):
-            overlay_image = overlay.get_image()
-            overlay_opacity = overlay.get_opacity()
-            self._image = Image.blend(
-                self._image, overlay_image, overlay_opacity)
-        return scene_update or overlay_update
+            frame = self._fade.blend(
+                self._image, overlay.get_image(), overlay.get_opacity(),
+                scene_changed)
+            if frame is self._frame:
+                # opacity did not change enough for a new step
+                damage = []
+            self._image = self._frame = frame
+        elif not (overlay and scene and scene.use_overlay()):
+            self._frame = None
+        if None in damage:
+            damage = [None]
+        for rect in damage:
+            self.add_damage(rect)
+        changed = scene_update or overlay_update
+        if self._hud:
+            changed = self._update_hud(changed, now) or changed
+        return changed
+
+    def _update_scene(self, scene):
+        if not self._stats:
+            return scene.update()
+        start = time.perf_counter()
+        res = scene.update()
+        self._stats.add(
+            f'scene:{type(scene).__name__}', time.perf_counter() - start)
+        return res
+
+    def _update_hud(self, changed, now):
+        if changed or self._hud_base is None:
+            self._hud_base = self._image
+        elif now - self._hud_time < self.HUD_INTERVAL:
+            return False
+        self._hud_time = now
+        stats = self._stats
+        frame = stats.get('frame')
+        text = (
+            f'{stats.get_fps()} fps  cpu {stats.get_cpu_percent():.0f}%\n'
+            f'p50 {frame.get_percentile(50) * 1000:.1f} ms  '
+            f'p99 {frame.get_percentile(99) * 1000:.1f} ms')
+        rect = (0, 0, self.get_size()[0], self.HUD_HEIGHT)
+        self._image = self._hud_base.copy()
+        image_draw = ImageDraw.Draw(self._image, 'RGBA')
+        image_draw.rectangle(rect, fill=(0, 0, 0, 160))
+        image_draw.multiline_text((4, 2), text, fill='#0f0')
+        self.add_damage(rect)
+        return True
+
+    def get_flush_stats(self):
+        if self._flush:
+            return self._flush.get_stats()
+        return None
 
     def start(self):
-        return
+        if self._flush:
+            self._flush.start()
 
     def stop(self):
-        return
+        if self._flush:
+            self._flush.stop()
 
     def redraw(self):
+        damage = self.pop_damage()
+        if not damage or not self._image:
+            return
+        inputs, self._inputs = self._inputs, []
+        if self._flush:
+            self._flush.submit(self._image, damage, inputs)
+        else:
+            self._write_frame(self._image, damage, inputs)
+
+    def _write_frame(self, image, damage, inputs=()):
+        self._write(image, damage)
+        if inputs:
+            now = time.time()
+            with self._input_lock:
+                for timestamp in inputs:
+                    self._input_latency.add(now - timestamp)
+
+    def _write(self, image, damage):
         return
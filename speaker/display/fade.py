@@ -0,0 +1,100 @@
+import numpy as np
+
+from PIL import Image
+
+
+class OverlayFade:
+
+    '''
+    Blends an overlay over scene frames
+
+    The opacity is quantized to a number of steps and blended frames are
+    cached until the scene frame or the overlay image changes, so a fade
+    blends every step only once.
+
+    Only the bounding box of the overlay content, everything differing
+    from the background color of the overlay, is blended per pixel with
+    integer arithmetic. Outside of it the result is the scene blended
+    with the background color, which is done with a lookup table.
+    '''
+
+    def __init__(self, steps=32):
+        self._steps = steps
+        self._frames = {}
+        self._scene = None
+        self._overlay = None
+        self._background = None
+        self._bbox = None
+        self._overlay_data = None
+
+    def get_opacity(self, opacity):
+        '''
+        Returns the opacity quantized to steps
+        '''
+        return round(opacity * self._steps) / self._steps
+
+    def clear(self):
+        self._frames.clear()
+        self._scene = None
+        self._overlay = None
+        self._overlay_data = None
+
+    def _set_overlay(self, image):
+        if image is self._overlay:
+            return
+        self._overlay = image
+        self._frames.clear()
+        data = np.asarray(image.convert('RGBA'))
+        background = data[0, 0]
+        mask = (data != background).any(axis=2)
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        self._background = tuple(int(x) for x in background)
+        if len(rows):
+            self._bbox = (
+                int(cols[0]), int(rows[0]),
+                int(cols[-1]) + 1, int(rows[-1]) + 1)
+            x0, y0, x1, y1 = self._bbox
+            self._overlay_data = data[y0:y1, x0:x1].astype(np.uint16)
+        else:
+            self._bbox = None
+            self._overlay_data = None
+
+    def _set_scene(self, image, changed):
+        if changed or image is not self._scene:
+            self._scene = image
+            self._frames.clear()
+
+    def blend(self, scene, overlay, opacity, scene_changed=False):
+        '''
+        Returns scene blended with overlay like Image.blend()
+
+        The returned frame is cached and must not be changed.
+        '''
+        self._set_overlay(overlay)
+        self._set_scene(scene, scene_changed)
+        opacity = self.get_opacity(opacity)
+        frame = self._frames.get(opacity)
+        if frame is None:
+            frame = self._blend(scene, opacity)
+            self._frames[opacity] = frame
+        return frame
+
+    def _blend(self, scene, opacity):
+        if scene.mode != 'RGBA':
+            scene = scene.convert('RGBA')
+        # outside of the bounding box the overlay is the background
+        values = np.arange(256, dtype=np.float32)
+        lut = np.concatenate([
+            values + opacity * (value - values)
+            for value in self._background])
+        frame = scene.point(np.clip(lut, 0, 255).astype(np.uint8).tolist())
+        if self._bbox:
+            weight = int(round(opacity * 256))
+            data = np.asarray(scene.crop(self._bbox), dtype=np.uint16)
+            data = (data * (256 - weight)
+                    + self._overlay_data * weight + 128) >> 8
+            frame.paste(
+                Image.fromarray(data.astype(np.uint8), 'RGBA'),
+                self._bbox[:2])
+        return frame
@@ -0,0 +1,84 @@
+import time
+
+from threading import Thread, Condition
+
+from PIL import Image
+
+
+class DisplayFlush:
+
+    '''
+    Double buffered asynchronous display flush
+
+    The render loop hands over finished frames with submit() and returns
+    immediately. The worker always writes the newest frame, frames which
+    were replaced before being written are dropped and their damage and
+    input events are merged into the newer frame.
+    '''
+
+    def __init__(self, display):
+        size = display.get_size()
+        self._display = display
+        self._front = Image.new('RGBA', size)
+        self._back = Image.new('RGBA', size)
+        self._damage = None
+        self._inputs = []
+        self._cond = Condition()
+        self._thread = None
+        self._running = False
+        self._frames = 0
+        self._dropped = 0
+        self._transfer_time = 0
+        self._transfer_total = 0
+
+    def get_stats(self):
+        with self._cond:
+            frames = self._frames
+            return {
+                'frames': frames,
+                'dropped': self._dropped,
+                'transfer_time': self._transfer_time,
+                'transfer_time_avg': (
+                    self._transfer_total / frames if frames else 0)}
+
+    def submit(self, image, damage, inputs=()):
+        with self._cond:
+            self._back.paste(image)
+            if self._damage is not None:
+                self._dropped += 1
+                damage = list(dict.fromkeys(self._damage + damage))
+            self._damage = damage
+            self._inputs.extend(inputs)
+            self._cond.notify()
+
+    def start(self):
+        self._running = True
+        self._thread = Thread(target=self._thread_fn, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1)
+
+    def _thread_fn(self):
+        while True:
+            with self._cond:
+                while self._running and self._damage is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                self._front, self._back = self._back, self._front
+                damage = self._damage
+                inputs = self._inputs
+                self._damage = None
+                self._inputs = []
+            start = time.perf_counter()
+            self._display._write_frame(self._front, damage, inputs)
+            transfer_time = time.perf_counter() - start
+            with self._cond:
+                self._frames += 1
+                self._transfer_time = transfer_time
+                self._transfer_total += transfer_time
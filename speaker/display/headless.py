@@ -0,0 +1,30 @@
+from .display import Display
+
+
+class DisplayHeadless(Display):
+
+    '''
+    Display without any hardware
+
+    Frames are rendered as usual but not written anywhere. Useful to run
+    the speaker or profile rendering without a panel or X server.
+    '''
+
+    WIDTH = 240
+    HEIGHT = 240
+
+    def __init__(self, speaker, **kwargs):
+        super().__init__(speaker, **kwargs)
+        self._frames = 0
+        self._bytes_written = 0
+
+    def get_frames(self):
+        return self._frames
+
+    def get_bytes_written(self):
+        return self._bytes_written
+
+    def _write(self, image, damage):
+        self._frames += 1
+        for x0, y0, x1, y1 in damage:
+            self._bytes_written += (x1 - x0) * (y1 - y0) * 2
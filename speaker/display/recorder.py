@@ -0,0 +1,185 @@
+import os
+import sys
+import mmap
+import time
+import struct
+import tempfile
+
+from PIL import Image
+
+from .headless import DisplayHeadless
+
+
+class Recording:
+
+    '''
+    Ring file of raw RGBA frames
+
+    The file starts with a header, followed by a ring of index entries
+    (frame number, timestamp, data number) and a ring of data slots with
+    raw RGBA frames. A frame identical to the previous one only gets an
+    index entry referencing the data of the previous frame. Frames
+    whose data was already overwritten are skipped when reading.
+    '''
+
+    MAGIC = b'SPKREC1\0'
+    HEADER = struct.Struct('<8sIIIIQQ')
+    ENTRY = struct.Struct('<QdQ')
+
+    def __init__(self, path, size=None, entries=4096, slots=64):
+        self._path = path
+        if size:
+            self._create(path, size, entries, slots)
+        self._file = open(path, 'r+b')
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        (magic, width, height, self._entries, self._slots, self._count,
+         self._data_count) = self.HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f'not a recording: {path}')
+        self._size = (width, height)
+        self._frame_size = width * height * 4
+        self._data_offset = (
+            self.HEADER.size + self._entries * self.ENTRY.size)
+
+    def _create(self, path, size, entries, slots):
+        file_size = (
+            self.HEADER.size + entries * self.ENTRY.size
+            + slots * size[0] * size[1] * 4)
+        with open(path, 'wb') as f:
+            f.write(self.HEADER.pack(
+                self.MAGIC, size[0], size[1], entries, slots, 0, 0))
+            f.truncate(file_size)
+
+    def get_size(self):
+        return self._size
+
+    def get_count(self):
+        return self._count
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+    def _write_header(self):
+        self.HEADER.pack_into(
+            self._mmap, 0, self.MAGIC, *self._size, self._entries,
+            self._slots, self._count, self._data_count)
+
+    def add(self, image, timestamp=None, duplicate=False):
+        '''
+        Adds a frame, duplicate frames reference the previous data
+        '''
+        if timestamp is None:
+            timestamp = time.time()
+        if not duplicate or not self._data_count:
+            offset = (
+                self._data_offset
+                + (self._data_count % self._slots) * self._frame_size)
+            self._mmap[offset:offset + self._frame_size] = image.tobytes()
+            self._data_count += 1
+        self.ENTRY.pack_into(
+            self._mmap,
+            self.HEADER.size + (self._count % self._entries) * self.ENTRY.size,
+            self._count, timestamp, self._data_count - 1)
+        self._count += 1
+        self._write_header()
+
+    def get_frames(self):
+        '''
+        Returns the available frames as (timestamp, data) tuples
+        '''
+        frames = []
+        first_data = max(0, self._data_count - self._slots)
+        for seq in range(max(0, self._count - self._entries), self._count):
+            offset = self.HEADER.size + (seq % self._entries) * self.ENTRY.size
+            entry_seq, timestamp, data = self.ENTRY.unpack_from(
+                self._mmap, offset)
+            if entry_seq == seq and data >= first_data:
+                frames.append((timestamp, data))
+        return frames
+
+    def get_image(self, data):
+        offset = self._data_offset + (data % self._slots) * self._frame_size
+        return Image.frombytes(
+            'RGBA', self._size,
+            self._mmap[offset:offset + self._frame_size])
+
+    def export_apng(self, path, min_duration=1):
+        '''
+        Exports the available frames to an animated png
+
+        Duplicate frames extend the duration of the previous frame.
+        Durations are in ms, at least min_duration.
+        '''
+        frames = []
+        for timestamp, data in self.get_frames():
+            if frames and frames[-1][1] == data:
+                continue
+            frames.append((timestamp, data))
+        if not frames:
+            return False
+        images = [self.get_image(data) for _, data in frames]
+        timestamps = [t for t, _ in frames]
+        durations = [
+            max(min_duration, int((end - start) * 1000))
+            for start, end in zip(timestamps, timestamps[1:])]
+        durations.append(max(min_duration, durations[-1] if durations else 0))
+        images[0].save(
+            path, format='PNG', save_all=True, append_images=images[1:],
+            duration=durations, loop=0)
+        return True
+
+
+class DisplayRecorder(DisplayHeadless):
+
+    '''
+    Display recording frames without any hardware
+
+    Every redraw is added to a Recording, frames without dirty tiles are
+    stored as references to the previous frame. If apng is set, the
+    recording is exported to an animated png on stop.
+
+    Use functools.partial to pass the options, for example
+    Speaker(display=partial(DisplayRecorder, apng='scene.png'), ...).
+    '''
+
+    FILE = os.path.join(tempfile.gettempdir(), 'speaker-recording.bin')
+    ENTRIES = 4096
+    SLOTS = 64
+
+    def __init__(
+            self, speaker, path=FILE, entries=ENTRIES, slots=SLOTS,
+            apng=None, **kwargs):
+        super().__init__(speaker, **kwargs)
+        self._recording = Recording(
+            path, size=self.get_size(), entries=entries, slots=slots)
+        self._apng = apng
+
+    def get_recording(self):
+        return self._recording
+
+    def redraw(self):
+        self._recording.add(self._image, duplicate=not self._dirty)
+        super().redraw()
+
+    def stop(self):
+        super().stop()
+        if self._apng:
+            self._recording.export_apng(self._apng)
+        self._recording.close()
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit(f'usage: {sys.argv[0]} RECORDING APNG')
+    recording = Recording(sys.argv[1])
+    frames = len(recording.get_frames())
+    if not recording.export_apng(sys.argv[2]):
+        sys.exit('no frames recorded')
+    print(f'exported {frames} frames to {sys.argv[2]}')
+
+
+if __name__ == '__main__':
+    main()
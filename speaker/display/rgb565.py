@@ -0,0 +1,122 @@
+import numpy as np
+
+from PIL import Image
+from RPi import GPIO
+
+
+ST7789_MADCTL = 0x36
+
+
+class RGB565Output:
+
+    '''
+    Output stage for ST7789 panels
+
+    Converts RGBA frames to big-endian RGB565 into a preallocated buffer
+    and writes each address window to spidev in one contiguous transfer.
+    Frames are pasted into a preallocated array, nothing is allocated
+    per frame.
+    By default the rotation is done by the panel through the MADCTL
+    register, so windows are sent in image coordinates without rotating
+    any pixels.
+    '''
+
+    # MADCTL values matching the rotations of the ST7789 library, which
+    # initializes the panel with 0x70 and rotates in software
+    MADCTL = {0: 0x70, 90: 0x10, 180: 0xB0, 270: 0xD0}
+    CHUNK_SIZE = 4096
+
+    def __init__(self, st7789, size, rotation=0, hw_rotation=True):
+        if rotation not in self.MADCTL:
+            raise ValueError(f'Invalid rotation {rotation}')
+        self._st7789 = st7789
+        self._spi = st7789._spi
+        self._dc = st7789._dc
+        self._size = size
+        self._rotation = rotation
+        self._hw_rotation = hw_rotation
+        width, height = size
+        self._buffer = np.empty(width * height * 2, dtype=np.uint8)
+        self._tmp = np.empty(width * height, dtype=np.uint8)
+        self._frame = np.zeros((height, width, 4), dtype=np.uint8)
+        # an image sharing the memory of _frame, frombuffer marks it
+        # readonly, which would make paste copy it to a new image
+        self._frame_image = Image.frombuffer(
+            'RGBA', size, self._frame, 'raw', 'RGBA', 0, 1)
+        self._frame_image.readonly = 0
+        self._bytes_written = 0
+        if hw_rotation:
+            st7789.command(ST7789_MADCTL)
+            st7789.data(self.MADCTL[rotation])
+
+    def get_bytes_written(self):
+        return self._bytes_written
+
+    def get_window(self, rect):
+        '''
+        Maps a rect of the image to the panel address window
+
+        Returns (x0, y0, x1, y1), inclusive, in panel coordinates.
+        '''
+        x0, y0, x1, y1 = rect
+        w, h = self._size
+        rotation = 0 if self._hw_rotation else self._rotation // 90
+        if rotation == 1:
+            return (y0, w - x1, y1 - 1, w - 1 - x0)
+        elif rotation == 2:
+            return (w - x1, h - y1, w - 1 - x0, h - 1 - y0)
+        elif rotation == 3:
+            return (h - y1, x0, h - 1 - y0, x1 - 1)
+        return (x0, y0, x1 - 1, y1 - 1)
+
+    def convert(self, frame, rect):
+        '''
+        Converts a rect of a (h, w, 4) uint8 frame to RGB565
+
+        Returns a memoryview into the reused output buffer, which is only
+        valid until the next call.
+        '''
+        x0, y0, x1, y1 = rect
+        src = frame[y0:y1, x0:x1]
+        if not self._hw_rotation:
+            src = np.rot90(src, self._rotation // 90)
+        rows, cols = src.shape[:2]
+        count = rows * cols
+        out = self._buffer[:count * 2].reshape(rows, cols, 2)
+        tmp = self._tmp[:count].reshape(rows, cols)
+        hi, lo = out[..., 0], out[..., 1]
+        # hi: rrrrrggg, lo: gggbbbbb
+        np.bitwise_and(src[..., 0], 0xF8, out=hi)
+        np.right_shift(src[..., 1], 5, out=tmp)
+        np.bitwise_or(hi, tmp, out=hi)
+        np.bitwise_and(src[..., 1], 0x1C, out=lo)
+        np.left_shift(lo, 3, out=lo)
+        np.right_shift(src[..., 2], 3, out=tmp)
+        np.bitwise_or(lo, tmp, out=lo)
+        return memoryview(self._buffer[:count * 2])
+
+    def write(self, image, rects=None):
+        '''
+        Writes the given rects of a RGBA image to the panel
+        '''
+        width, height = self._size
+        if rects is None:
+            rects = [(0, 0, width, height)]
+        if not rects:
+            return
+        self._frame_image.paste(image, (0, 0))
+        for rect in rects:
+            data = self.convert(self._frame, rect)
+            self._st7789.set_window(*self.get_window(rect))
+            self._send(data)
+
+    def _send(self, data):
+        GPIO.output(self._dc, 1)
+        if hasattr(self._spi, 'writebytes2'):
+            # writebytes2 takes any buffer and splits it by the
+            # spidev bufsiz itself
+            self._spi.writebytes2(data)
+        else:
+            for i in range(0, len(data), self.CHUNK_SIZE):
+                self._spi.xfer(data[i:i + self.CHUNK_SIZE].tolist())
+        self._bytes_written += len(data)
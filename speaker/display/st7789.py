@@ -2,6 +2,7 @@ import RPi.GPIO as GPIO
 from ST7789 import ST7789
 
 from .display import Display
+from .rgb565 import RGB565Output
 
 from PIL import Image
 
@@ -11,14 +12,16 @@ class DisplayST7789(Display):
     SPI_SPEED_MHZ = 50
     WIDTH = 240
     HEIGHT = 240
+    ROTATION = 90
+    HW_ROTATION = True
 
-    def __init__(self, speaker):
-        super().__init__(speaker)
+    def __init__(self, speaker, **kwargs):
+        super().__init__(speaker, **kwargs)
         # Standard display setup for Pirate Audio,
         # except omit the backlight pin
         self._st7789 = ST7789(
-            rotation=90,     # Needed to display the right
-                             # way up on Pirate Audio
+            rotation=self.ROTATION,  # Needed to display the right
+                                     # way up on Pirate Audio
             port=0,          # SPI port
             cs=1,            # SPI port Chip-select channel
             dc=9,            # BCM pin used for data/command
@@ -27,6 +30,9 @@ class DisplayST7789(Display):
         )
         self._st7789.display(
             Image.new('RGB', (self._st7789.width, self._st7789.height)))
+        self._output = RGB565Output(
+            self._st7789, self.get_size(), rotation=self.ROTATION,
+            hw_rotation=self.HW_ROTATION)
         # Set up backlight pin as a PWM output at 500Hz
         GPIO.setup(13, GPIO.OUT)
         self._backlight = GPIO.PWM(13, 500)
@@ -36,12 +42,16 @@ class DisplayST7789(Display):
         self._brightness = brightness
         self._backlight.ChangeDutyCycle(brightness)
 
-    def redraw(self):
-        if self._image:
-            self._st7789.display(self._image)
+    def get_bytes_written(self):
+        return self._output.get_bytes_written()
+
+    def _write(self, image, damage):
+        self._output.write(image, damage)
 
     def start(self):
+        super().start()
         self._backlight.start(self._brightness)
 
     def stop(self):
+        super().stop()
         self._backlight.stop()
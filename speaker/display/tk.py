@@ -9,16 +9,22 @@ class DisplayTK(Display):
 
     WIDTH = 240
     HEIGHT = 240
+    # tkinter may only be used from the main thread
+    THREADED_FLUSH = False
 
-    def __init__(self, speaker):
-        super().__init__(speaker)
+    def __init__(self, speaker, **kwargs):
+        super().__init__(speaker, **kwargs)
         self._tk = tkinter.Tk()
         self._tk.geometry(f'{self.WIDTH}x{self.HEIGHT}')
         self._tk.resizable(False, False)
         self._tk.title('Speaker')
+        self._imagetk = None
 
-    def redraw(self):
-        imagetk = ImageTk.PhotoImage(self._image)
-        label_image = tkinter.Label(self._tk, image=imagetk)
+    def _write(self, image, damage):
+        self._imagetk = ImageTk.PhotoImage(image)
+        label_image = tkinter.Label(self._tk, image=self._imagetk)
         label_image.place(x=0, y=0, width=self.WIDTH, height=self.HEIGHT)
+
+    def redraw(self):
+        super().redraw()
         self._tk.update()
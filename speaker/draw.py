@@ -1,8 +1,13 @@
 import time
+import math
 import os
 
+from collections import OrderedDict
+from threading import Lock
+
 from PIL import Image, ImageDraw
 
+from .pacing import Pacing
 from .utils import image_tint, draw_progress_bar
 
 
@@ -11,35 +16,103 @@ Primitives
 '''
 
 
+class SpriteAtlas:
+
+    '''
+    Process-wide cache for image maps
+
+    Every sheet is decoded once. Sprites are cropped, tinted and resized
+    on request and kept in a lru cache keyed by (sheet, index, tint, size).
+    Returned images are shared and must not be modified in place.
+    '''
+
+    CACHE_SIZE = 128
+
+    def __init__(self, cache_size=CACHE_SIZE):
+        self._lock = Lock()
+        self._sheets = {}
+        self._sprites = OrderedDict()
+        self._cache_size = cache_size
+        self._hits = 0
+        self._misses = 0
+
+    def get_sheet(self, file):
+        with self._lock:
+            sheet = self._sheets.get(file)
+            if sheet is None:
+                sheet = Image.open(file)
+                sheet.load()
+                self._sheets[file] = sheet
+            return sheet
+
+    def get(self, file, idx, tint=None, size=None):
+        key = (file, idx, tint, size)
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                self._hits += 1
+                return sprite
+            self._misses += 1
+        sheet = self.get_sheet(file)
+        height = sheet.size[1]
+        sprite = sheet.crop((height * idx, 0, height * idx + height, height))
+        if tint:
+            sprite = image_tint(sprite, tint=tint)
+        if size and tuple(size) != sprite.size:
+            sprite = sprite.resize(size)
+        with self._lock:
+            self._sprites[key] = sprite
+            while len(self._sprites) > self._cache_size:
+                self._sprites.popitem(last=False)
+        return sprite
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'sprites': len(self._sprites),
+                'sheets': len(self._sheets)}
+
+    def clear(self):
+        with self._lock:
+            self._sheets.clear()
+            self._sprites.clear()
+
+
+sprite_atlas = SpriteAtlas()
+
+
 class Icon:
 
     def __init__(self, idx=None):
         image_dir = os.path.join(os.path.dirname(__file__), 'images')
         icons = os.path.join(image_dir, 'icons_256.png')
-        image_map = ImageMap(icons)
-        if idx is not None:
-            self._image = image_map.get(idx)
-        else:
-            self._image = image_map.new()
+        self._image_map = ImageMap(icons)
+        self._idx = idx
 
-    def get_image(self):
-        return self._image
+    def get_image(self, size=None):
+        if self._idx is not None:
+            return self._image_map.get(self._idx, size=size)
+        image = self._image_map.new()
+        if size:
+            image = image.resize(size)
+        return image
 
 
 class ImageMap:
 
     def __init__(self, file, foreground=None):
-        image = Image.open(file)
-        if not foreground:
-            self.image = image
-        else:
-            self.image = image_tint(image, tint=foreground)
+        self.file = file
+        self.foreground = foreground
+        self.image = sprite_atlas.get_sheet(file)
 
-    def get(self, idx):
-        height = self.image.size[1]
-        cropped = self.image.crop(
-            (height * idx, 0, height * idx + height, height))
-        return cropped
+    def get(self, idx, size=None):
+        if size is not None:
+            size = tuple(size)
+        return sprite_atlas.get(
+            self.file, idx, tint=self.foreground, size=size)
 
     def new(self, color='#fff'):
         size = self.image.size[1]
@@ -51,8 +124,14 @@ class Overlay:
 
     '''
     Represents a overlay to be drawn
+
+    While fading the overlay is updated with FADE_PACING, otherwise it
+    is static until the fade starts or it ends.
     '''
 
+    PACING = Pacing.static()
+    FADE_PACING = Pacing.fps(30)
+
     def __init__(
             self, display, opacity=1.0, duration=0.5, fade_duration=0,
             fade_in=False, fade_out=False, active=True, background='#000'):
@@ -68,6 +147,7 @@ class Overlay:
         self._fade_in = fade_in
         self._fade_out = fade_out
         self._background = background
+        self._damage = []
         print(f'creating overlay {self}')
 
     def get_display(self):
@@ -91,14 +171,20 @@ class Overlay:
     def set_active(self, active=True):
         self._active = active
 
-    def update(self):
-        if not self._timer:
-            self._timer = time.time()
-        current_time = time.time()
+    def add_damage(self, rect=None):
+        if rect is None:
+            rect = (0, 0, *self._image.size)
+        x0, y0, x1, y1 = rect
+        self._damage.append((
+            math.floor(x0), math.floor(y0), math.ceil(x1), math.ceil(y1)))
+
+    def pop_damage(self):
+        damage, self._damage = self._damage, []
+        return damage
+
+    def _get_durations(self):
         duration = self._duration
         fade_duration = self._fade_duration
-
-        # get correct durations
         if self._fade_in and self._fade_out:
             if fade_duration == 0:
                 fade_duration = duration / 2
@@ -107,6 +193,43 @@ class Overlay:
             if fade_duration == 0:
                 fade_duration = duration
             duration = max(duration, fade_duration)
+        return duration, fade_duration
+
+    def _is_fading(self):
+        if not self._timer:
+            return False
+        duration, fade_duration = self._get_durations()
+        current_duration = time.time() - self._timer
+        if self._fade_in and current_duration < fade_duration:
+            return True
+        return self._fade_out and current_duration >= duration - fade_duration
+
+    def get_pacing(self):
+        return self.FADE_PACING if self._is_fading() else self.PACING
+
+    def get_deadline(self):
+        '''
+        Returns the time of the next update not covered by the pacing
+        '''
+        current_time = time.time()
+        if not self._timer or self._draw:
+            return current_time
+        if self._is_fading():
+            return None
+        duration, fade_duration = self._get_durations()
+        if self._fade_out:
+            return self._timer + duration - fade_duration
+        if duration > 0:
+            return self._timer + duration
+        return None
+
+    def update(self):
+        if not self._timer:
+            self._timer = time.time()
+        current_time = time.time()
+
+        # get correct durations
+        duration, fade_duration = self._get_durations()
 
         # check for fade effect
         current_duration = current_time - self._timer
@@ -193,21 +316,28 @@ class OverlayButtonPause(OverlayImageMap):
         super().__init__(**kwargs)
 
 
-class OverlayButtonVolumeDown(OverlayImageMap):
+class OverlayButtonVolume(OverlayImageMap):
+
+    '''
+    Button overlay with a bar showing the volume of the client
+
+    The bar is redrawn whenever the volume differs from the drawn one,
+    the action changing it usually completes after the first draw.
+    '''
 
     def __init__(self, display, **kwargs):
+        self._volume = None
         image_dir = os.path.join(os.path.dirname(__file__), 'images')
         file = os.path.join(image_dir, 'buttons_256.png')
         kwargs['display'] = display
         kwargs['file'] = file
-        kwargs['idx'] = 3
         super().__init__(**kwargs)
 
     def _draw_overlay(self, image):
         overlay = super()._draw_overlay(image)
         overlay_draw = ImageDraw.Draw(overlay, 'RGBA')
         max_volume = self.get_speaker().MAX_VOLUME
-        volume = self.get_client().get_volume()
+        volume = self._volume = self.get_client().get_volume()
         ow, oh = overlay.size
         ob = ow * 0.02
         rect = (ob, 2 * ob, ow - ob, 3 * ob)
@@ -216,6 +346,8 @@ class OverlayButtonVolumeDown(OverlayImageMap):
         return overlay
 
     def update(self):
+        if self.get_client().get_volume() != self._volume:
+            self._draw = True
         res = super().update()
         if res:
             self._image = self._draw_overlay(
@@ -223,34 +355,18 @@ class OverlayButtonVolumeDown(OverlayImageMap):
         return res
 
 
-class OverlayButtonVolumeUp(OverlayImageMap):
+class OverlayButtonVolumeDown(OverlayButtonVolume):
 
     def __init__(self, display, **kwargs):
-        image_dir = os.path.join(os.path.dirname(__file__), 'images')
-        file = os.path.join(image_dir, 'buttons_256.png')
-        kwargs['display'] = display
-        kwargs['file'] = file
-        kwargs['idx'] = 4
-        super().__init__(**kwargs)
+        kwargs['idx'] = 3
+        super().__init__(display, **kwargs)
 
-    def _draw_overlay(self, image):
-        overlay = super()._draw_overlay(image)
-        overlay_draw = ImageDraw.Draw(overlay, 'RGBA')
-        max_volume = self.get_speaker().MAX_VOLUME
-        volume = self.get_client().get_volume()
-        ow, oh = overlay.size
-        ob = ow * 0.02
-        rect = (ob, 2 * ob, ow - ob, 3 * ob)
-        draw_progress_bar(
-            overlay_draw, volume, max_volume, rect, (255, 255, 255))
-        return overlay
 
-    def update(self):
-        res = super().update()
-        if res:
-            self._image = self._draw_overlay(
-                self._overlay.get(self._idx))
-        return res
+class OverlayButtonVolumeUp(OverlayButtonVolume):
+
+    def __init__(self, display, **kwargs):
+        kwargs['idx'] = 4
+        super().__init__(display, **kwargs)
 
 
 class OverlayButtonPrevious(OverlayImageMap):
@@ -311,6 +427,18 @@ class OverlayIconAirplay(OverlayImageMap):
         super().__init__(**kwargs)
 
 
+class OverlayIconMPD(OverlayImageMap):
+
+    def __init__(self, display, **kwargs):
+        image_dir = os.path.join(os.path.dirname(__file__), 'images')
+        file = os.path.join(image_dir, 'icons_256.png')
+        kwargs['display'] = display
+        kwargs['file'] = file
+        kwargs['foreground'] = kwargs.get('foreground', None)
+        kwargs['idx'] = 3
+        super().__init__(**kwargs)
+
+
 '''
 Icons
 '''
@@ -332,3 +460,9 @@ class IconAirplay(Icon):
 
     def __init__(self):
         super().__init__(2)
+
+
+class IconMPD(Icon):
+
+    def __init__(self):
+        super().__init__(3)
@@ -0,0 +1,139 @@
+import os
+import select
+
+from threading import Thread, Lock
+
+import alsaaudio
+
+
+class Mixer:
+
+    '''
+    Cached ALSA mixer
+
+    The volume and mute state are read once and kept in memory, reads
+    never call ALSA. A thread polls the mixer descriptors and refreshes
+    the state when it was changed by another program. Writes update the
+    cache immediately and are done by the thread, writes arriving before
+    the previous one was done are coalesced into the newest value.
+
+    Listeners are called with (volume, muted) only when the state
+    actually changed, from the thread that changed it.
+    '''
+
+    def __init__(self, control='Master', cardindex=-1):
+        self._mixer = alsaaudio.Mixer(control, cardindex=cardindex)
+        self._lock = Lock()
+        self._listeners = []
+        self._volume, self._muted = self._read()
+        self._pending_volume = None
+        self._pending_muted = None
+        self._thread = None
+        self._running = False
+        self._wake_r, self._wake_w = os.pipe()
+
+    def _read(self):
+        volume = self._mixer.getvolume()[0]
+        try:
+            muted = bool(self._mixer.getmute()[0])
+        except alsaaudio.ALSAAudioError:
+            # no playback switch
+            muted = False
+        return volume, muted
+
+    def get_volume(self):
+        return self._volume
+
+    def set_volume(self, volume):
+        volume = max(0, min(100, int(volume)))
+        with self._lock:
+            self._pending_volume = volume
+        self._set_state(volume, self._muted)
+        self._request_write()
+
+    def is_muted(self):
+        return self._muted
+
+    def set_muted(self, muted):
+        muted = bool(muted)
+        with self._lock:
+            self._pending_muted = muted
+        self._set_state(self._volume, muted)
+        self._request_write()
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def _set_state(self, volume, muted):
+        with self._lock:
+            if (volume, muted) == (self._volume, self._muted):
+                return
+            self._volume, self._muted = volume, muted
+        for fn in list(self._listeners):
+            fn(volume, muted)
+
+    def _request_write(self):
+        if self._running:
+            os.write(self._wake_w, b'\0')
+        else:
+            self._write()
+
+    def _write(self):
+        with self._lock:
+            volume, self._pending_volume = self._pending_volume, None
+            muted, self._pending_muted = self._pending_muted, None
+        try:
+            if volume is not None:
+                self._mixer.setvolume(volume)
+            if muted is not None:
+                self._mixer.setmute(int(muted))
+        except alsaaudio.ALSAAudioError as e:
+            print(f'mixer write failed: {e}')
+
+    def _refresh(self):
+        self._mixer.handleevents()
+        with self._lock:
+            if (self._pending_volume is not None
+                    or self._pending_muted is not None):
+                # our own write is pending, it would be reverted
+                return
+        self._set_state(*self._read())
+
+    def start(self):
+        self._running = True
+        self._thread = Thread(target=self._thread_fn, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        os.write(self._wake_w, b'\0')
+        if self._thread.is_alive():
+            self._thread.join(timeout=1)
+        self._write()
+
+    def _thread_fn(self):
+        poll = select.poll()
+        poll.register(self._wake_r, select.POLLIN)
+        fds = set()
+        for fd, mask in self._mixer.polldescriptors():
+            poll.register(fd, mask)
+            fds.add(fd)
+        while self._running:
+            events = poll.poll()
+            if not self._running:
+                return
+            changed = False
+            for fd, _ in events:
+                if fd == self._wake_r:
+                    os.read(self._wake_r, 64)
+                elif fd in fds:
+                    changed = True
+            self._write()
+            if changed:
+                self._refresh()
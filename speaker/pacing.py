@@ -0,0 +1,96 @@
+import math
+
+
+class Pacing:
+
+    '''
+    Describes how often a scene or overlay needs to be updated
+
+    A pacing is static (only updated on events), periodic, or aligned
+    to multiples of the period in wall clock time, like a clock updating
+    on the second boundary.
+    '''
+
+    __slots__ = ('period', 'align')
+
+    def __init__(self, period=None, align=False):
+        self.period = period
+        self.align = align
+
+    def __repr__(self):
+        if self.period is None:
+            return 'Pacing.static()'
+        return f'Pacing.interval({self.period}, align={self.align})'
+
+    @classmethod
+    def static(cls):
+        return cls()
+
+    @classmethod
+    def fps(cls, fps):
+        return cls(1.0 / fps)
+
+    @classmethod
+    def interval(cls, period, align=False):
+        return cls(period, align=align)
+
+    @classmethod
+    def every_second(cls):
+        return cls(1.0, align=True)
+
+    def is_static(self):
+        return self.period is None
+
+    def get_deadline(self, last):
+        '''
+        Returns the next deadline after an update at time last
+        '''
+        if self.period is None:
+            return None
+        if self.align:
+            return (math.floor(last / self.period) + 1) * self.period
+        return last + self.period
+
+
+class FrameScheduler:
+
+    '''
+    Keeps track of the updates of the scene and overlay slots
+
+    Deadlines are calculated from the pacing and the time of the last
+    update of the source in a slot. Deadlines are never made up for: a
+    late update is done once and the next deadline is based on it, the
+    skipped frames are counted as dropped.
+    '''
+
+    def __init__(self):
+        self._last = {}
+        self._frames = 0
+        self._dropped = 0
+
+    def get_deadline(self, slot, source, pacing, now):
+        '''
+        Returns the next deadline of source in slot, None if static
+        '''
+        if pacing.is_static():
+            return None
+        last = self._last.get(slot)
+        if last is None or last[0] is not source:
+            return now
+        return pacing.get_deadline(last[1])
+
+    def frame(self, slot, source, pacing, now):
+        '''
+        Records an update of source in slot at now
+        '''
+        last = self._last.get(slot)
+        if (last is not None and last[0] is source
+                and pacing.period and not pacing.align):
+            late = now - pacing.get_deadline(last[1])
+            if late > pacing.period:
+                self._dropped += int(late / pacing.period)
+        self._last[slot] = (source, now)
+        self._frames += 1
+
+    def get_stats(self):
+        return {'frames': self._frames, 'dropped': self._dropped}
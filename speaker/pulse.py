@@ -0,0 +1,233 @@
+import pulsectl
+
+
+class PulseMirror:
+
+    '''
+    In process mirror of PulseAudio sink inputs and cards
+
+    The objects are listed once by sync() and then kept up to date per
+    event with a single info query for new and changed objects. Sink
+    inputs are indexed by application.name and cards by device.api, so
+    lookups do not query pulse.
+    '''
+
+    # facility: (list method, info method, indexed property)
+    FACILITIES = {
+        'sink_input': ('sink_input_list', 'sink_input_info',
+                       'application.name'),
+        'card': ('card_list', 'card_info', 'device.api'),
+    }
+
+    def __init__(self, facilities=None):
+        if facilities is None:
+            facilities = self.FACILITIES
+        self._facilities = [f for f in facilities if f in self.FACILITIES]
+        self._objects = {f: {} for f in self._facilities}
+        self._by_prop = {f: {} for f in self._facilities}
+
+    def get_facilities(self):
+        return self._facilities
+
+    def sync(self, pulse):
+        '''
+        Replaces the mirror with the current objects of pulse
+        '''
+        for facility in self._facilities:
+            self._objects[facility] = {}
+            self._by_prop[facility] = {}
+            for obj in getattr(pulse, self.FACILITIES[facility][0])():
+                self._add(facility, obj)
+
+    def apply(self, events, pulse):
+        '''
+        Applies events to the mirror, returns the events of mirrored
+        facilities with the new object, None if it was removed
+        '''
+        changes = []
+        for ev in events:
+            # pulsectl facilities are enum values comparing equal to names
+            facility = next(
+                (f for f in self._facilities if ev.facility == f), None)
+            if facility is None:
+                continue
+            self._remove(facility, ev.index)
+            obj = None
+            if ev.t != 'remove':
+                try:
+                    obj = getattr(pulse, self.FACILITIES[facility][1])(
+                        ev.index)
+                except pulsectl.PulseIndexError:
+                    # removed before the query, the remove event follows
+                    pass
+                else:
+                    self._add(facility, obj)
+            changes.append((ev, obj))
+        return changes
+
+    def _add(self, facility, obj):
+        self._objects[facility][obj.index] = obj
+        value = obj.proplist.get(self.FACILITIES[facility][2])
+        self._by_prop[facility].setdefault(value, {})[obj.index] = obj
+
+    def _remove(self, facility, index):
+        obj = self._objects[facility].pop(index, None)
+        if obj is None:
+            return
+        value = obj.proplist.get(self.FACILITIES[facility][2])
+        objs = self._by_prop[facility].get(value)
+        if objs is not None:
+            objs.pop(index, None)
+            if not objs:
+                del self._by_prop[facility][value]
+
+    def get(self, facility, index):
+        return self._objects.get(facility, {}).get(index)
+
+    def get_all(self, facility):
+        return list(self._objects.get(facility, {}).values())
+
+    def get_sink_inputs(self, application_name):
+        '''
+        Returns the sink inputs with the application.name
+        '''
+        objs = self._by_prop.get('sink_input', {}).get(application_name)
+        return list(objs.values()) if objs else []
+
+    def get_cards(self, device_api):
+        '''
+        Returns the cards with the device.api
+        '''
+        objs = self._by_prop.get('card', {}).get(device_api)
+        return list(objs.values()) if objs else []
+
+
+class PulseEvents:
+
+    '''
+    Coalescing PulseAudio event pipeline
+
+    Only the facilities declared by the clients in PULSE_FACILITIES are
+    subscribed. listen() waits for an event and then drains the burst
+    following it for WINDOW seconds. Events for the same object are
+    coalesced into one, so a client gets a single batched update_pulse()
+    call per burst with only the events of its facilities.
+
+    The events are applied to a PulseMirror first, clients are notified
+    with the applied changes and look up objects in the mirror.
+
+    pulsectl also calls the event callback during blocking queries, like
+    the info queries of dispatch(). Those events are kept and returned
+    by the next listen() without waiting.
+    '''
+
+    WINDOW = 0.05
+    # pulsectl treats a timeout of 0 as no timeout
+    DRAIN_TIMEOUT = 0.001
+
+    def __init__(self, clients, window=WINDOW):
+        self._clients = clients
+        self._window = window
+        self._pulse = None
+        self._mirror = PulseMirror(self.get_facilities())
+        self._events = []
+        self._stop = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_pulse(self):
+        return self._pulse
+
+    def get_mirror(self):
+        return self._mirror
+
+    def get_facilities(self):
+        facilities = []
+        for c in self._clients:
+            for facility in c.PULSE_FACILITIES:
+                if facility not in facilities:
+                    facilities.append(facility)
+        return facilities
+
+    def open(self):
+        self._pulse = pulsectl.Pulse('speaker')
+        facilities = self.get_facilities()
+        if facilities:
+            self._pulse.event_mask_set(*facilities)
+            self._pulse.event_callback_set(self._on_event)
+
+    def close(self):
+        if self._pulse:
+            self._pulse.close()
+            self._pulse = None
+
+    def _on_event(self, ev):
+        self._events.append(ev)
+        if self._stop:
+            raise pulsectl.PulseLoopStop
+
+    def listen(self, timeout=None):
+        '''
+        Returns the coalesced events of the next burst, an empty list on
+        timeout
+        '''
+        if self._events:
+            # queued during queries since the last listen, only drain
+            self._stop = False
+            self._pulse.event_listen(timeout=self.DRAIN_TIMEOUT)
+        else:
+            self._stop = True
+            self._pulse.event_listen(timeout=timeout)
+            if self._events:
+                # the first event stopped the loop, drain the rest of
+                # the burst
+                self._stop = False
+                self._pulse.event_listen(timeout=self._window)
+        # events during queries must not stop them, only queue them
+        self._stop = False
+        events, self._events = self._events, []
+        return self.coalesce(events)
+
+    @staticmethod
+    def coalesce(events):
+        '''
+        Merges the events per object, a new object stays new when it
+        changed afterwards and a removal replaces everything before
+        '''
+        merged = {}
+        for ev in events:
+            key = (str(ev.facility), ev.index)
+            last = merged.pop(key, None)
+            if (last is not None and last.t == 'new'
+                    and ev.t == 'change'):
+                ev = last
+            merged[key] = ev
+        return list(merged.values())
+
+    def sync(self):
+        '''
+        Fills the mirror and lets every client check the current state,
+        used after connecting
+        '''
+        self._mirror.sync(self._pulse)
+        for c in self._clients:
+            if c.PULSE_FACILITIES:
+                c.update_pulse([], self._mirror)
+
+    def dispatch(self, events):
+        '''
+        Applies the events to the mirror and delivers one batched update
+        to every client with matching changes
+        '''
+        changes = self._mirror.apply(events, self._pulse)
+        for c in self._clients:
+            client_changes = [
+                (ev, obj) for ev, obj in changes
+                if ev.facility in c.PULSE_FACILITIES]
+            if client_changes:
+                c.update_pulse(client_changes, self._mirror)
@@ -0,0 +1,229 @@
+import asyncio
+import heapq
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .pulse import PulseEvents
+from .scene import SceneIntro, SceneOutro
+
+
+class AsyncRuntime:
+
+    '''
+    Runs a speaker on an asyncio event loop
+
+    Pulse events and client file descriptors are handled on one loop.
+    Rendering is done in a single thread executor, state changes from
+    input events are serialized with rendering through a lock. Button
+    commands are queued by the controls and handled by the render pass,
+    blocking client actions run in the io executor.
+
+    The speaker, its clients, scenes and displays are used unchanged,
+    the replaced wakeup and call_action methods adapt them.
+    '''
+
+    def __init__(self, speaker):
+        self._speaker = speaker
+        self._loop = None
+        self._lock = None
+        self._woken = None
+        self._deadlines = []
+        self._render_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='render')
+        self._io_executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix='io')
+        self._pulse_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='pulse')
+        self._pulse = None
+        self._filenos = {}
+
+    def run(self):
+        try:
+            asyncio.run(self._main())
+        except KeyboardInterrupt:
+            pass
+
+    def wakeup(self, deadline=None):
+        '''
+        Thread safe replacement for Speaker.wakeup
+        '''
+        self._loop.call_soon_threadsafe(self._post_wakeup, deadline)
+
+    def call_blocking(self, fn, *args, **kwargs):
+        '''
+        Runs a blocking call in the io executor, returns a future
+
+        Thread safe replacement for Speaker.call_action, the render pass
+        calls it from the render executor.
+        '''
+        future = self._io_executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._on_blocking_done)
+        return future
+
+    def _on_blocking_done(self, future):
+        if not future.cancelled() and future.exception():
+            print(f'runtime call failed: {future.exception()!r}')
+        self.wakeup()
+
+    def _post_wakeup(self, deadline):
+        if deadline is not None:
+            heapq.heappush(self._deadlines, deadline)
+        self._woken.set()
+
+    def _wrap_speaker(self):
+        speaker = self._speaker
+        speaker.wakeup = self.wakeup
+        speaker.call_action = self.call_blocking
+
+    async def _main(self):
+        speaker = self._speaker
+        self._loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        self._woken = asyncio.Event()
+        self._wrap_speaker()
+        tasks = []
+        try:
+            speaker.mixer.start()
+            speaker.control.start()
+            speaker.display.start()
+            speaker._prepare()
+            if speaker._intro:
+                await self._show_scene(SceneIntro)
+            speaker._running = True
+            for c in speaker.get_clients():
+                fileno = self._get_fileno(c)
+                c.start()
+                if fileno is not None:
+                    self._filenos[c] = fileno
+                    self._watch_client(c)
+            tasks.append(asyncio.create_task(self._pulse_task()))
+            await self._run_loop()
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            if speaker._outro and speaker._running:
+                speaker._running = False
+                await self._show_scene(SceneOutro)
+            speaker._running = False
+            for c in speaker.get_clients():
+                fileno = self._filenos.pop(c, None)
+                if fileno is not None:
+                    self._loop.remove_reader(fileno)
+                c.stop()
+            speaker.control.stop()
+            speaker.display.stop()
+            speaker.mixer.stop()
+            self._pulse_executor.submit(self._pulse_close)
+            for executor in (self._pulse_executor, self._io_executor,
+                             self._render_executor):
+                executor.shutdown(wait=False)
+
+    def _get_fileno(self, client):
+        try:
+            return client.get_fileno()
+        except OSError:
+            return None
+
+    def _watch_client(self, client):
+        fileno = self._filenos[client]
+        self._loop.add_reader(fileno, self._on_readable, client, fileno)
+
+    def _on_readable(self, client, fileno):
+        # stop watching until the client consumed the data
+        self._loop.remove_reader(fileno)
+        self._loop.create_task(self._read_client(client))
+
+    async def _read_client(self, client):
+        # clients only queue what they read and wake up the speaker, so
+        # reading does not hold up rendering
+        try:
+            await self._loop.run_in_executor(
+                self._io_executor, client.on_readable)
+        except OSError as e:
+            print(f'runtime read failed: {e!r}')
+        if self._speaker._running:
+            self._watch_client(client)
+
+    async def _render(self):
+        speaker = self._speaker
+        async with self._lock:
+            await self._loop.run_in_executor(
+                self._render_executor, speaker._update)
+            await self._loop.run_in_executor(
+                self._render_executor, speaker._render)
+
+    async def _wait(self):
+        deadline = self._speaker.get_next_deadline()
+        while True:
+            now = time.time()
+            if self._deadlines and self._deadlines[0] <= now:
+                heapq.heappop(self._deadlines)
+                return
+            timeouts = [d for d in (deadline, *self._deadlines[:1])
+                        if d is not None]
+            timeout = min(timeouts) - now if timeouts else None
+            if timeout is not None and timeout <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._woken.wait(), timeout)
+            except asyncio.TimeoutError:
+                continue
+            self._woken.clear()
+            return
+
+    async def _run_loop(self):
+        while True:
+            await self._render()
+            await self._wait()
+
+    async def _show_scene(self, scene):
+        speaker = self._speaker
+        speaker.display.set_scene(scene)
+        while True:
+            async with self._lock:
+                await self._loop.run_in_executor(
+                    self._render_executor, speaker._update)
+            scene = speaker.display.get_scene()
+            if not scene or not scene.is_active():
+                break
+            async with self._lock:
+                await self._loop.run_in_executor(
+                    self._render_executor, speaker._render)
+            await self._wait()
+
+    def _pulse_open(self):
+        self._pulse = PulseEvents(self._speaker.get_clients())
+        self._pulse.open()
+        self._pulse.sync()
+        self._speaker._check_client()
+        self.wakeup()
+
+    def _pulse_close(self):
+        if self._pulse:
+            self._pulse.close()
+            self._pulse = None
+
+    def _pulse_dispatch(self, events):
+        self._speaker._handle_pulse_events(events, self._pulse)
+
+    async def _next_pulse_events(self):
+        # the pulse connection lives in its own thread, listen with a
+        # timeout so the task can be cancelled
+        while True:
+            events = await self._loop.run_in_executor(
+                self._pulse_executor, self._pulse.listen, 1)
+            if events:
+                return events
+
+    async def _pulse_task(self):
+        async with self._lock:
+            await self._loop.run_in_executor(
+                self._pulse_executor, self._pulse_open)
+        while self._speaker._running:
+            events = await self._next_pulse_events()
+            async with self._lock:
+                await self._loop.run_in_executor(
+                    self._pulse_executor, self._pulse_dispatch, events)
@@ -1,33 +1,107 @@
 import os
 import time
-import io
+
+from threading import Lock
 
 from fonts.ttf import RobotoMedium as UserFont
-from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from PIL import Image, ImageDraw, ImageFont
 
+from ..artwork import artwork
 from ..client import ClientInfo
 from ..draw import ImageMap
+from ..pacing import Pacing
 from ..utils import text_in_rect, draw_progress_bar
+from .compositor import LayerCompositor
 from .scene import Scene
 
 
+class ControlSprites:
+
+    '''
+    Control button layers of SceneClient
+
+    The layers for the playing and stopped state are prepared once per
+    display size and shared by all scene instances. The alpha of the
+    buttons is lowered with a lookup table.
+    '''
+
+    ALPHA_REDUCTION = int(255 * 0.65)
+
+    def __init__(self):
+        image_dir = os.path.join(
+            os.path.dirname(__file__), '..', 'images')
+        self._file = os.path.join(image_dir, 'buttons_32.png')
+        self._lock = Lock()
+        self._layers = {}
+        self._alpha = [
+            max(0, x - self.ALPHA_REDUCTION) for x in range(256)]
+
+    def prepare(self, size):
+        '''
+        Prepares the layers for all states for the given size
+        '''
+        for playing in (False, True):
+            self.get(size, playing)
+
+    def get(self, size, playing):
+        key = (tuple(size), playing)
+        with self._lock:
+            layer = self._layers.get(key)
+            if layer is None:
+                layer = self._draw(key[0], playing)
+                self._layers[key] = layer
+            return layer
+
+    def _get_button(self, buttons_map, idx, size):
+        button = buttons_map.get(idx, size=size)
+        r, g, b, a = button.convert('RGBA').split()
+        return Image.merge('RGBA', (r, g, b, a.point(self._alpha)))
+
+    def _draw(self, size, playing):
+        buttons_map = ImageMap(self._file)
+        iw, ih = size
+        ibw = int(iw * 0.12)
+        ibh = int(ih * 0.12)
+        ibs = min(ibw, ibh)
+        buttons = (
+            # vol down
+            (3, (int(ibw * 0.25), int(ih * 0.25 - ibh * 0.5))),
+            # vol up
+            (4, (int(iw - ibw * 1.25), int(ih * 0.25 - ibh * 0.5))),
+            # play / pause button
+            (2 if playing else 1,
+             (int(ibw * 0.25), int(ih * 0.75 - ibh * 0.5))),
+            # next
+            (6, (int(iw - ibw * 1.25), int(ih * 0.75 - ibh * 0.5))),
+        )
+        # create image with controls
+        image = Image.new('RGBA', size, (0, 0, 0, 0))
+        for idx, pos in buttons:
+            image.alpha_composite(
+                self._get_button(buttons_map, idx, (ibs, ibs)), pos)
+        return image
+
+
+controls = ControlSprites()
+
+
 class SceneClient(Scene):
 
     UPDATE_INTERVAL = 0.5
+    PACING = Pacing.interval(UPDATE_INTERVAL)
+    TEXT_GROUPS = frozenset((
+        ClientInfo.METADATA, ClientInfo.TRANSPORT, ClientInfo.VOLUME))
 
     def __init__(self, display, **kwargs):
         super().__init__(display, **kwargs)
-        image_dir = os.path.join(
-            os.path.dirname(__file__), '..', 'images')
-        file = os.path.join(image_dir, 'buttons_32.png')
         self._blur = False
         self._font = ImageFont.truetype(UserFont, 20)
         self._font_big = ImageFont.truetype(UserFont, 42)
-        self._buttons_map = ImageMap(file)
         self._image_back = Image.new('RGBA', display.get_size())
         self._image_controls = Image.new('RGBA', display.get_size())
         self._image_text = Image.new('RGBA', display.get_size())
         self._image_front = Image.new('RGBA', display.get_size())
+        self._compositor = LayerCompositor(display.get_size(), 4)
         self._info_back = {}
         self._info_controls = {}
         self._info_text = {}
@@ -36,6 +110,11 @@ class SceneClient(Scene):
     def _draw(self):
         res = (self._draw_back(), self._draw_controls(),
                self._draw_text(), self._draw_front())
+        layers = (self._image_back, self._image_controls,
+                  self._image_text, self._image_front)
+        for index, changed in enumerate(res):
+            if changed:
+                self._compositor.set_layer(index, layers[index])
         return any(res)
 
     def _draw_back(self):
@@ -44,16 +123,27 @@ class SceneClient(Scene):
             return
         info = client.get_info()
 
-        # default image if no album art
-        image_draw = ImageDraw.Draw(self._image_back)
-        image_draw.rectangle((0, 0, * self._image_back.size), '#000')
+        # album art is rendered in the background, keep the current
+        # layer until the new one is ready
+        layer = None
         if info.album_art:
-            image = Image.open(io.BytesIO(info.album_art))
-            image = image.resize(self._image_back.size).convert('RGBA')
-            if self._blur:
-                image = image.filter(ImageFilter.GaussianBlur(radius=5))
-            image.putalpha(96)
-            self._image_back.alpha_composite(image)
+            layer = artwork.get_layer(
+                info.album_art, self._image_back.size, blur=self._blur,
+                callback=self.get_speaker().wakeup,
+                key=info.album_art_id,
+                cache=self.get_speaker().get_art_cache())
+            if layer is None and 'layer' in self._info_back:
+                return False
+        if 'layer' in self._info_back and self._info_back['layer'] is layer:
+            return False
+        self._info_back['layer'] = layer
+
+        # default image if no album art
+        if layer:
+            self._image_back.paste(layer)
+        else:
+            image_draw = ImageDraw.Draw(self._image_back)
+            image_draw.rectangle((0, 0, * self._image_back.size), '#000')
         return True
 
     def _draw_controls(self):
@@ -62,63 +152,12 @@ class SceneClient(Scene):
             return
         info = client.get_info()
         # check for current controls change
-        if info.status == ClientInfo.STATUS_PLAYING:
-            index_image = 'image_playing'
-        else:
-            index_image = 'image_stopped'
-        if self._info_controls.get('current') == index_image:
+        playing = info.status == ClientInfo.STATUS_PLAYING
+        if self._info_controls.get('playing') == playing:
             return False
-        #
-
-        if index_image in self._info_controls:
-            image = self._info_controls[index_image]
-        else:
-            iw, ih = self._image_controls.size
-            ibw = int(iw * 0.12)
-            ibh = int(ih * 0.12)
-            ibs = min(ibw, ibh)
-            icons, xy = [], []
-            # vol down
-            icons.append(
-                self._buttons_map.get(3).resize((ibs, ibs)))
-            xy.append((
-                int(ibw * 0.25),
-                int(ih * 0.25 - ibh * 0.5)))
-            # vol up
-            icons.append(
-                self._buttons_map.get(4).resize((ibs, ibs)))
-            xy.append((
-                int(iw - ibw * 1.25),
-                int(ih * 0.25 - ibh * 0.5)))
-            # play / pause button
-            icons.append(
-                self._buttons_map
-                .get(2 if info.status == ClientInfo.STATUS_PLAYING else 1)
-                .resize((ibs, ibs)))
-            xy.append(
-                (int(ibw * 0.25),
-                 int(ih * 0.75 - ibh * 0.5)))
-            # next
-            icons.append(
-                self._buttons_map.get(6).resize((ibs, ibs)))
-            xy.append(
-                (int(iw - ibw * 1.25),
-                 int(ih * 0.75 - ibh * 0.5)))
-            # create image with controls
-            image = Image.new('RGBA', self._image_controls.size, (0, 0, 0, 0))
-            for icon, pos in zip(icons, xy):
-                olddata = icon.getdata()
-                newdata = []
-                for rgba in olddata:
-                    newdata.append(
-                        (rgba[0], rgba[1], rgba[2],
-                         max(0, rgba[3] - int(255 * 0.65))))
-                icon.putdata(newdata)
-                image.alpha_composite(icon, pos)
-        # store and set current image
-        self._image_controls = image
-        self._info_controls[index_image] = image
-        self._info_controls['current'] = index_image
+        self._image_controls = controls.get(
+            self._image_controls.size, playing)
+        self._info_controls['playing'] = playing
         return True
 
     def _draw_text(self):
@@ -126,25 +165,19 @@ class SceneClient(Scene):
         if not client:
             return
         info = client.get_info()
-        redraw = False
 
         # check if a redraw is needed
-        if (self._info_text.get('volume') != info.volume
-                or self._info_text.get('position') != info.position
-                or self._info_text.get('duration') != info.duration
-                or self._info_text.get('artist') != info.artist
-                or self._info_text.get('title') != info.title
-                or self._info_text.get('album') != info.album):
-            redraw = True
-
-        # return if no redraw is required
-        if not redraw:
+        last_info = self._info_text.get('info')
+        if last_info is not None and last_info.version == info.version:
+            return False
+        self._info_text['info'] = info
+        if not info.changed_since(last_info) & self.TEXT_GROUPS:
             return False
 
         # redraw image
-        self._image_text = Image.new('RGBA', self._image_text.size)
-        image_draw = ImageDraw.Draw(self._image_text)
         iw, ih = self._image_text.size
+        self._image_text.paste((0, 0, 0, 0), (0, 0, iw, ih))
+        image_draw = ImageDraw.Draw(self._image_text)
         ib = int(min(iw, ih) * 0.02)
         ics = int(min(iw, ih) * 0.1)
 
@@ -166,20 +199,15 @@ class SceneClient(Scene):
             self._font,
             pos_remaining,
             fill='#fff')
-        self._info_text['position'] = position
-        self._info_text['duration'] = duration
 
         # Artist
         box = text_in_rect(image_draw, info.artist, self._font, (ib, ics, iw - ib, int(2 * ics)))
-        self._info_text['artist'] = info.artist
 
         # Album
         text_in_rect(image_draw, info.album, self._font, (ics, box[3], iw - ics, int(1.4 * ics + box[3])))
-        self._info_text['album'] = info.album
 
         # Song title
         text_in_rect(image_draw, info.title, self._font_big, (ib, int(3.5 * ics), iw - ib, 8 * ics))
-        self._info_text['title'] = info.title
 
         # draw volume
         if info.volume:
@@ -187,7 +215,6 @@ class SceneClient(Scene):
             pos_vol = (
                 ib, 3 * ib, int(((iw - 2 * ib) / 100) * volume), 4 * ib)
             image_draw.rounded_rectangle(xy=pos_vol, radius=ib, fill='#fffa')
-            self._info_text['volume'] = volume
 
         return True
 
@@ -195,13 +222,17 @@ class SceneClient(Scene):
         client = self.get_client()
         if not client:
             return
-        redraw = False
+        # the front only shows the client icon
+        if self._info_front.get('icon') is client.ICON:
+            return False
+        self._info_front['icon'] = client.ICON
         iw, ih = self._image_front.size
         ib = int(min(iw, ih) * 0.02)
         ics = int(min(iw, ih) * 0.15)
-        icon = self.get_client().ICON().get_image().resize((ics, ics))
+        icon = client.ICON().get_image((ics, ics))
+        self._image_front.paste((0, 0, 0, 0), (0, 0, iw, ih))
         self._image_front.alpha_composite(icon, (ib, ih - 2 * ib - ics))
-        return redraw
+        return True
 
     def update(self):
         current_time = time.time()
@@ -214,12 +245,8 @@ class SceneClient(Scene):
 
         redraw = self._draw()
         if redraw or current_duration <= self.UPDATE_INTERVAL:
-            self._image = Image.alpha_composite(
-                self._image_back, self._image_controls)
-            self._image = Image.alpha_composite(
-                self._image, self._image_text)
-            self._image = Image.alpha_composite(
-                self._image, self._image_front)
+            self._compositor.composite()
+            self._image = self._compositor.get_image()
             self._timer = current_time
             return True
         return False
@@ -0,0 +1,60 @@
+from PIL import Image
+
+
+class LayerCompositor:
+
+    '''
+    Composites a stack of RGBA layers into reused buffers
+
+    For every layer a buffer with the composite of all layers up to it
+    is kept. When a layer changes only it and the layers above are
+    composited again, starting from the cached composite below it. The
+    top buffer is the output.
+
+    The result is opaque. Layers are pasted with their alpha as mask,
+    which over an opaque buffer is the same as alpha compositing but
+    works in place, so no images are allocated per frame.
+
+    Buffers and layers use straight, not premultiplied, alpha. PIL has
+    no premultiplied modes, so premultiplying would need an extra pass
+    per layer and converting back for drawing. Over an opaque buffer
+    the masked paste needs no premultiplied input.
+    '''
+
+    def __init__(self, size, count, background=(0, 0, 0, 255)):
+        self._box = (0, 0, *size)
+        self._background = background
+        self._layers = [None] * count
+        self._buffers = [
+            Image.new('RGBA', size, background) for _ in range(count)]
+        self._dirty = 0
+
+    def get_image(self):
+        return self._buffers[-1]
+
+    def set_layer(self, index, image):
+        '''
+        Sets the image of a layer, also to mark it as changed
+        '''
+        self._layers[index] = image
+        if self._dirty is None or index < self._dirty:
+            self._dirty = index
+
+    def composite(self):
+        '''
+        Composites all changed layers, returns True if the output changed
+        '''
+        if self._dirty is None:
+            return False
+        for index in range(self._dirty, len(self._layers)):
+            buffer = self._buffers[index]
+            if index:
+                buffer.paste(self._buffers[index - 1], self._box)
+            else:
+                buffer.paste(self._background, self._box)
+            layer = self._layers[index]
+            if layer is not None:
+                buffer.paste(layer, self._box, layer)
+                buffer.putalpha(255)
+        self._dirty = None
+        return True
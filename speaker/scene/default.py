@@ -6,6 +6,7 @@ from PIL import ImageDraw
 from PIL import ImageFont
 
 from .scene import Scene
+from ..pacing import Pacing
 from ..utils import text_in_rect
 
 
@@ -20,6 +21,8 @@ class SceneDefault(Scene):
 
     WAKE_UP_TIME = 32
     WAKE_UP_DURATION = 8
+    CLOCK_PACING = Pacing.every_second()
+    ANIM_PACING = Pacing.fps(30)
     ICON_FACTOR = 0.65
 
     def __init__(self, display, **kwargs):
@@ -61,8 +64,37 @@ class SceneDefault(Scene):
             font=self._font_text, rect=rect_text)
         image_draw.line(((ib, (ih/3)*2), (iw-ib, (ih/3)*2)), '#fff', 1)
         for i, c in enumerate(self.get_speaker().get_clients()):
-            icon = c.ICON().get_image().resize((ics, ics))
+            icon = c.ICON().get_image((ics, ics))
             image.alpha_composite(icon, (cw*i+cdw, (ch*2)+cdh))
+        # only the clock changes between redraws
+        if self._last_time:
+            self.add_damage(rect_time_big)
+            self.add_damage(rect_time_small)
+        else:
+            self.add_damage()
+
+    def get_pacing(self):
+        if self.get_speaker().is_active():
+            return self.CLOCK_PACING
+        duration = time.time() - self._timer
+        brightness = self.get_display().get_brightness()
+        if duration > self.WAKE_UP_TIME:
+            return self.ANIM_PACING
+        elif duration > self.WAKE_UP_DURATION:
+            # dimming, the clock is not visible once the backlight is off
+            if brightness > 0:
+                return self.ANIM_PACING
+            return self.PACING
+        elif brightness != 10:
+            return self.ANIM_PACING
+        return self.CLOCK_PACING
+
+    def get_deadline(self):
+        if self.get_speaker().is_active():
+            return None
+        if time.time() - self._timer > self.WAKE_UP_DURATION:
+            return self._timer + self.WAKE_UP_TIME
+        return self._timer + self.WAKE_UP_DURATION
 
     def update(self):
         cur_time = time.time()
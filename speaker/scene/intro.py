@@ -4,6 +4,7 @@ import simpleaudio as sa
 from fonts.ttf import RobotoMedium as UserFont
 from PIL import Image, ImageDraw, ImageFont, ImageChops
 
+from ..pacing import Pacing
 from ..utils import text_in_rect
 from .scene import Scene
 
@@ -19,6 +20,8 @@ class SceneIntro(Scene):
 
     DURATION = 6
     ANIM_DURATION = 4
+    # animated during the whole scene
+    PACING = Pacing.fps(30)
 
     def __init__(self, display, **kwargs):
         kwargs |= {'background': '#fff', 'overlay': False}
@@ -29,7 +32,7 @@ class SceneIntro(Scene):
         self._inv_image = ImageChops.invert(self._image)
         self._mask = self._image.copy().convert('L')
         self._factor = 0
-        self._volume = self.get_speaker().mixer.getvolume()[0]
+        self._volume = self.get_speaker().mixer.get_volume()
         self._draw_text(self._inv_image)
         self._draw_mask(self._mask, self._factor)
         self._wave_object = sa.WaveObject.from_wave_file('misc/startup.wav')
@@ -38,12 +41,12 @@ class SceneIntro(Scene):
     def _begin(self):
         self._timer = time.time()
         mixer = self.get_speaker().mixer
-        mixer.setvolume(30)
+        mixer.set_volume(30)
         self._song = self._wave_object.play()
 
     def _end(self):
         mixer = self.get_speaker().mixer
-        mixer.setvolume(self._volume)
+        mixer.set_volume(self._volume)
         self.set_active(False)
 
     def _draw_logo(self, image, factor=0.8):
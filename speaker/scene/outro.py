@@ -4,6 +4,7 @@ from fonts.ttf import RobotoMedium as UserFont
 from PIL import Image, ImageDraw, ImageFont
 
 from .scene import Scene
+from ..pacing import Pacing
 from ..utils import text_in_rect
 
 
@@ -11,6 +12,8 @@ class SceneOutro(Scene):
 
     DURATION = 4
     ANIM_DURATION = 2
+    # animated during the whole scene
+    PACING = Pacing.fps(30)
 
     def __init__(self, display, **kwargs):
         kwargs |= {'overlay': False, 'active': True}
@@ -1,12 +1,21 @@
+import math
+
 from PIL import Image
 
+from ..pacing import Pacing
+
 
 class Scene:
 
     '''
     Represents a scene to be drawn
+
+    The pacing tells how often the scene needs to be updated, deadlines
+    returned by get_deadline() are additional single updates.
     '''
 
+    PACING = Pacing.static()
+
     def __init__(self, display, active=True, overlay=True, background='#000'):
         self._image = Image.new('RGBA', display.get_size(), background)
         self._background = background
@@ -14,6 +23,7 @@ class Scene:
         self._active = active
         self._display = display
         self._overlay = overlay
+        self._damage = []
         print(f'creating scene {self}')
 
     def get_display(self):
@@ -34,6 +44,27 @@ class Scene:
     def set_active(self, active=True):
         self._active = active
 
+    def add_damage(self, rect=None):
+        if rect is None:
+            rect = (0, 0, *self._image.size)
+        x0, y0, x1, y1 = rect
+        self._damage.append((
+            math.floor(x0), math.floor(y0), math.ceil(x1), math.ceil(y1)))
+
+    def pop_damage(self):
+        damage, self._damage = self._damage, []
+        return damage
+
+    def get_pacing(self):
+        return self.PACING
+
+    def get_deadline(self):
+        '''
+        Returns the time of the next update not covered by the pacing,
+        None if there is none
+        '''
+        return None
+
     def use_overlay(self):
         return self._overlay
 
@@ -0,0 +1,98 @@
+import time
+
+from collections import deque
+
+
+class RollingStats:
+
+    '''
+    Rolling window of samples with percentiles
+    '''
+
+    WINDOW = 256
+
+    def __init__(self, window=WINDOW):
+        self._samples = deque(maxlen=window)
+
+    def add(self, value):
+        self._samples.append(value)
+
+    def get_count(self):
+        return len(self._samples)
+
+    def get_percentile(self, percentile):
+        if not self._samples:
+            return 0
+        samples = sorted(self._samples)
+        idx = round(percentile / 100 * (len(samples) - 1))
+        return samples[idx]
+
+    def get_summary(self):
+        if not self._samples:
+            return {'count': 0}
+        samples = sorted(self._samples)
+        count = len(samples)
+        return {
+            'count': count,
+            'mean': sum(samples) / count,
+            'p50': samples[round(0.50 * (count - 1))],
+            'p90': samples[round(0.90 * (count - 1))],
+            'p99': samples[round(0.99 * (count - 1))],
+            'max': samples[-1]}
+
+
+class FrameStats:
+
+    '''
+    Frame timing statistics of the speaker
+
+    Rolling stats are kept per phase of a render pass (update, display,
+    redraw and the whole frame), per scene class and for the bytes
+    written to the display per frame. Durations are in seconds.
+    '''
+
+    WINDOW = 256
+    CPU_INTERVAL = 1
+
+    def __init__(self, window=WINDOW):
+        self._window = window
+        self._stats = {}
+        self._frames = deque(maxlen=window)
+        self._cpu_sample = (time.time(), time.process_time())
+        self._cpu_percent = 0
+
+    def add(self, name, value):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = RollingStats(self._window)
+        stats.add(value)
+
+    def get(self, name):
+        return self._stats.get(name) or RollingStats(self._window)
+
+    def frame(self, scene, duration, bytes_written=0):
+        '''
+        Records a rendered frame
+        '''
+        name = type(scene).__name__ if scene else 'None'
+        self.add('frame', duration)
+        self.add(f'frame:{name}', duration)
+        self.add('bytes', bytes_written)
+        self._frames.append(time.time())
+
+    def get_fps(self):
+        now = time.time()
+        return sum(1 for t in self._frames if t > now - 1)
+
+    def get_cpu_percent(self):
+        now, cpu = time.time(), time.process_time()
+        last_now, last_cpu = self._cpu_sample
+        if now - last_now >= self.CPU_INTERVAL:
+            self._cpu_percent = 100 * (cpu - last_cpu) / (now - last_now)
+            self._cpu_sample = (now, cpu)
+        return self._cpu_percent
+
+    def get_summary(self):
+        return {
+            name: stats.get_summary()
+            for name, stats in sorted(self._stats.items())}
@@ -1,44 +1,163 @@
 import os
 import math
 
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+
 from PIL import Image, ImageFont
 from PIL.ImageColor import getcolor, getrgb
 from PIL.ImageOps import grayscale
 
 
-def text_in_rect(canvas, text, font, rect, line_spacing=1.1, fill=None):
+class TextLayout:
+
+    '''
+    Represents text reflowed and scaled to fit into a rect
+
+    A layout is immutable and can be drawn any number of times.
+    '''
+
+    def __init__(self, font, lines, bounds):
+        self.font = font
+        self.lines = lines
+        self.bounds = bounds
+
+    def draw(self, canvas, fill=None):
+        for pos, line in self.lines:
+            canvas.text(pos, line, font=self.font, fill=fill)
+        return self.bounds
+
+
+LAYOUT_CACHE_SIZE = 256
+WORD_CACHE_SIZE = 1024
+
+_layouts = OrderedDict()
+_layouts_lock = Lock()
+_word_widths = {}
+_word_widths_lock = Lock()
+
+
+@lru_cache(maxsize=64)
+def get_font(path, size):
+    return ImageFont.truetype(path, size)
+
+
+def _get_word_width(font, word):
+    '''
+    Returns the width of word, memoized in a LRU per font
+    '''
+    key = (font.path, font.size)
+    with _word_widths_lock:
+        widths = _word_widths.get(key)
+        if widths is None:
+            widths = _word_widths[key] = OrderedDict()
+        width = widths.get(word)
+        if width is not None:
+            widths.move_to_end(word)
+            return width
+    width = font.getsize(word)[0]
+    with _word_widths_lock:
+        widths[word] = width
+        while len(widths) > WORD_CACHE_SIZE:
+            widths.popitem(last=False)
+    return width
+
+
+def _reflow(words, font, width, max_lines):
+    space = _get_word_width(font, ' ')
+    lines = []
+    line, line_width, measured = None, 0, True
+    for word in words:
+        word_width = _get_word_width(font, word)
+        if line is not None:
+            # summed widths ignore kerning and are never narrower than
+            # the joined line, only measure when they don't fit
+            candidate = f'{line} {word}'
+            candidate_width = line_width + space + word_width
+            if candidate_width <= width:
+                line, line_width, measured = candidate, candidate_width, False
+                continue
+            candidate_width = font.getsize(candidate)[0]
+            if candidate_width <= width:
+                line, line_width, measured = candidate, candidate_width, True
+                continue
+        if line is not None:
+            lines.append((line, measured))
+        if word_width > width or len(lines) == max_lines:
+            return None
+        line, line_width, measured = word, word_width, True
+    if line is not None:
+        lines.append((line, measured))
+    # lines accepted by the estimate alone are verified once
+    for line, measured in lines:
+        if not measured and font.getsize(line)[0] > width:
+            return None
+    return [line for line, _ in lines]
+
+
+def layout_text(text, font, rect, line_spacing=1.1):
+
+    '''
+    Reflows and scales text to fit into rect, centred
+
+    The largest font size not exceeding font.size is found by binary
+    search. Finished layouts are memoized keyed by text, font and rect.
+    Returns a TextLayout or None if the text does not fit at all.
+    '''
+
+    key = (text, font.path, font.size, tuple(rect), line_spacing)
+    with _layouts_lock:
+        layout = _layouts.get(key)
+        if layout is not None:
+            _layouts.move_to_end(key)
+            return layout
+
     width = rect[2] - rect[0]
     height = rect[3] - rect[1]
+    words = text.split(' ')
+    best = None
+    low, high = 1, font.size
+    while low <= high:
+        size = (low + high) // 2
+        line_height = int(size * line_spacing)
+        max_lines = math.floor(height / line_height) if line_height else 0
+        current = get_font(font.path, size)
+        lines = _reflow(words, current, width, max_lines)
+        if lines is not None:
+            best = (current, lines, line_height)
+            low = size + 1
+        else:
+            high = size - 1
+    if best is None:
+        return None
+
+    font, lines, line_height = best
+    y = int(rect[1] + (height / 2) - (len(lines) * line_height / 2)
+            - (line_height - font.size) / 2)
+    bounds = [rect[2], y, rect[0], y + len(lines) * line_height]
+    positions = []
+    for line in lines:
+        line_width = font.getsize(line)[0]
+        x = int(rect[0] + (width / 2) - (line_width / 2))
+        bounds[0] = min(bounds[0], x)
+        bounds[2] = max(bounds[2], x + line_width)
+        positions.append(((x, y), line))
+        y += line_height
+    layout = TextLayout(font, positions, tuple(bounds))
+
+    with _layouts_lock:
+        _layouts[key] = layout
+        while len(_layouts) > LAYOUT_CACHE_SIZE:
+            _layouts.popitem(last=False)
+    return layout
+
 
-    # Given a rectangle, reflow and scale text to fit, centred
-    while font.size > 0:
-        line_height = int(font.size * line_spacing)
-        max_lines = math.floor(height / line_height)
-        lines = []
-
-        # Determine if text can fit at current scale.
-        words = text.split(" ")
-
-        while len(lines) < max_lines and len(words) > 0:
-            line = []
-            while len(words) > 0 and font.getsize(" ".join(line + [words[0]]))[0] <= width:
-                line.append(words.pop(0))
-            lines.append(" ".join(line))
-
-        if (len(lines)) <= max_lines and len(words) == 0:
-            # Solution is found, render the text.
-            y = int(rect[1] + (height / 2) - (len(lines) * line_height / 2) - (line_height - font.size) / 2)
-            bounds = [rect[2], y, rect[0], y + len(lines) * line_height]
-            for line in lines:
-                line_width = font.getsize(line)[0]
-                x = int(rect[0] + (width / 2) - (line_width / 2))
-                bounds[0] = min(bounds[0], x)
-                bounds[2] = max(bounds[2], x + line_width)
-                canvas.text((x, y), line, font=font, fill=fill)
-                y += line_height
-            return tuple(bounds)
-
-        font = ImageFont.truetype(font.path, font.size - 1)
+def text_in_rect(canvas, text, font, rect, line_spacing=1.1, fill=None):
+    layout = layout_text(text, font, rect, line_spacing=line_spacing)
+    if layout is None:
+        return None
+    return layout.draw(canvas, fill=fill)
 
 
 def draw_progress_bar(canvas, progress, max_progress, rect, colour):
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+'''
+Compares the ST7789 library output path with RGB565Output
+
+Run on the Pirate Audio hardware:
+
+    python test/bench-st7789.py --frames 200
+
+Reports frames per second and cpu time per frame for full frames and
+for a single 40x40 window.
+'''
+import os
+import sys
+import time
+import argparse
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ST7789 import ST7789  # noqa: E402
+
+from speaker.display.rgb565 import RGB565Output  # noqa: E402
+
+
+def bench(name, fn, frames):
+    fn()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    for i in range(frames):
+        fn()
+    wall = time.perf_counter() - start_wall
+    cpu = time.process_time() - start_cpu
+    print(f'{name:<28} {frames / wall:8.1f} fps'
+          f' {wall / frames * 1000:8.2f} ms/frame'
+          f' {cpu / frames * 1000:8.2f} ms cpu/frame')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--rotation', type=int, default=90)
+    parser.add_argument('--spi-speed-mhz', type=int, default=50)
+    args = parser.parse_args()
+
+    st7789 = ST7789(
+        rotation=args.rotation, port=0, cs=1, dc=9, backlight=None,
+        spi_speed_hz=args.spi_speed_mhz * 1000 * 1000)
+    size = (st7789.width, st7789.height)
+    image = Image.effect_noise(size, 64).convert('RGBA')
+
+    bench(
+        'ST7789.display',
+        lambda: st7789.display(image), args.frames)
+
+    # the output stage changes MADCTL, create it after the library run
+    for hw_rotation in (False, True):
+        output = RGB565Output(
+            st7789, size, rotation=args.rotation, hw_rotation=hw_rotation)
+        bench(
+            f'RGB565Output hw={hw_rotation}',
+            lambda: output.write(image), args.frames)
+        bench(
+            f'RGB565Output hw={hw_rotation} 40x40',
+            lambda: output.write(image, [(80, 80, 120, 120)]),
+            args.frames)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+'''
+Stand-in MPD server for the mpd client
+
+Speaks the subset of the MPD protocol used by ClientMPD: status,
+currentsong, command lists, idle/noidle, readpicture in binary chunks,
+binarylimit and the playback and volume commands:
+
+    python test/mpd-fake.py --port 6600 --interval 10
+
+A playlist of three songs is playing, the first two have an embedded
+picture. Every interval seconds the next song starts and idle clients
+are notified of the player change.
+'''
+import io
+import shlex
+import time
+import argparse
+import threading
+import socketserver
+
+from PIL import Image
+
+
+SONGS = [
+    ('music/intro.mp3', 'Intro', 'The xx', 'xx', 128.0, '#c33'),
+    ('music/long.flac',
+     'A very long song title that needs to be wrapped over multiple lines',
+     'Artist', 'Album', 245.5, '#36c'),
+    ('music/no-picture.ogg', 'No Picture', 'Band', 'Singles', 61.0, None),
+]
+
+
+def make_picture(color, size=(600, 600)):
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    image = Image.blend(image, Image.new('RGB', size, color), 0.6)
+    data = io.BytesIO()
+    image.save(data, format='JPEG', quality=90)
+    return data.getvalue()
+
+
+class State:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = []
+        self.song = 0
+        self.state = 'play'
+        self.volume = 40
+        self.elapsed = 0.0
+        self.started = time.time()
+        self.pictures = {
+            song[0]: make_picture(song[5]) for song in SONGS if song[5]}
+
+    def get_elapsed(self):
+        if self.state == 'play':
+            return self.elapsed + time.time() - self.started
+        return self.elapsed
+
+    def set_state(self, state):
+        self.elapsed = self.get_elapsed()
+        self.started = time.time()
+        self.state = state
+
+    def set_song(self, song):
+        self.song = song % len(SONGS)
+        self.elapsed = 0.0
+        self.started = time.time()
+
+    def emit(self, *subsystems):
+        for conn in list(self.connections):
+            conn.add_events(subsystems)
+
+
+state = State()
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        self.events = set()
+        self.idle = None
+        self.binary_limit = 8192
+        with state.lock:
+            state.connections.append(self)
+        print(f'connected: {self.client_address}')
+
+    def finish(self):
+        with state.lock:
+            state.connections.remove(self)
+        print(f'disconnected: {self.client_address}')
+        super().finish()
+
+    def write(self, data):
+        try:
+            self.wfile.write(data)
+        except OSError:
+            pass
+
+    def add_events(self, subsystems):
+        # called with state.lock held
+        self.events.update(subsystems)
+        self.flush_idle()
+
+    def flush_idle(self, force=False):
+        if self.idle is None:
+            return
+        changed = sorted(
+            e for e in self.events if not self.idle or e in self.idle)
+        if not changed and not force:
+            return
+        self.events.difference_update(changed)
+        self.idle = None
+        self.write(''.join(f'changed: {e}\n' for e in changed).encode()
+                   + b'OK\n')
+
+    def handle(self):
+        self.write(b'OK MPD 0.23.5\n')
+        command_list = None
+        for line in self.rfile:
+            line = line.decode().strip()
+            if not line:
+                continue
+            print(f'request: {line}')
+            if line == 'command_list_ok_begin':
+                command_list = []
+                continue
+            if command_list is not None and line != 'command_list_end':
+                command_list.append(line)
+                continue
+            with state.lock:
+                if line == 'command_list_end':
+                    self.run_list(command_list)
+                    command_list = None
+                elif line == 'noidle':
+                    self.flush_idle(force=True)
+                elif line.split()[0] == 'idle':
+                    self.idle = set(line.split()[1:])
+                    self.flush_idle()
+                else:
+                    self.write(self.run(line) + b'OK\n')
+
+    def run_list(self, lines):
+        res = b''
+        for line in lines:
+            out = self.run(line)
+            if out.startswith(b'ACK'):
+                self.write(res + out)
+                return
+            res += out + b'list_OK\n'
+        self.write(res + b'OK\n')
+
+    def run(self, line):
+        name, *args = shlex.split(line)
+        fn = getattr(self, f'cmd_{name}', None)
+        if fn is None:
+            return f'ACK [5@0] {{{name}}} unknown command\n'.encode()
+        return fn(*args)
+
+    def cmd_ping(self):
+        return b''
+
+    def cmd_binarylimit(self, limit):
+        self.binary_limit = int(limit)
+        return b''
+
+    def cmd_status(self):
+        duration = SONGS[state.song][4]
+        elapsed = min(state.get_elapsed(), duration)
+        lines = [
+            f'volume: {state.volume}', 'repeat: 1', 'random: 0',
+            'single: 0', 'consume: 0', f'playlistlength: {len(SONGS)}',
+            f'state: {state.state}', f'song: {state.song}',
+            f'songid: {state.song + 1}',
+            f'time: {int(elapsed)}:{int(duration)}',
+            f'elapsed: {elapsed:.3f}', f'duration: {duration:.3f}']
+        return ''.join(f'{line}\n' for line in lines).encode()
+
+    def cmd_currentsong(self):
+        file, title, artist, album, duration, _ = SONGS[state.song]
+        lines = [
+            f'file: {file}', f'Title: {title}', f'Artist: {artist}',
+            f'Album: {album}', f'duration: {duration:.3f}',
+            f'Pos: {state.song}', f'Id: {state.song + 1}']
+        return ''.join(f'{line}\n' for line in lines).encode()
+
+    def cmd_readpicture(self, uri, offset):
+        data = state.pictures.get(uri)
+        if data is None:
+            return b''
+        offset = int(offset)
+        chunk = data[offset:offset + self.binary_limit]
+        return (f'size: {len(data)}\ntype: image/jpeg\n'
+                f'binary: {len(chunk)}\n').encode() + chunk + b'\n'
+
+    def cmd_play(self, *args):
+        state.set_state('play')
+        state.emit('player')
+        return b''
+
+    def cmd_pause(self, pause=None):
+        if pause is None:
+            pause = '1' if state.state == 'play' else '0'
+        state.set_state('pause' if pause == '1' else 'play')
+        state.emit('player')
+        return b''
+
+    def cmd_stop(self):
+        state.set_state('stop')
+        state.emit('player')
+        return b''
+
+    def cmd_next(self):
+        state.set_song(state.song + 1)
+        state.emit('player')
+        return b''
+
+    def cmd_previous(self):
+        state.set_song(state.song - 1)
+        state.emit('player')
+        return b''
+
+    def cmd_setvol(self, volume):
+        state.volume = max(0, min(100, int(volume)))
+        state.emit('mixer')
+        return b''
+
+
+def push(interval):
+    while True:
+        time.sleep(interval)
+        with state.lock:
+            if state.state == 'play':
+                state.set_song(state.song + 1)
+                state.emit('player', 'playlist')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6600)
+    parser.add_argument(
+        '--interval', type=float, default=10,
+        help='seconds until the next song starts, 0 to disable')
+    args = parser.parse_args()
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(
+        (args.host, args.port), Handler)
+    server.daemon_threads = True
+    if args.interval:
+        threading.Thread(
+            target=push, args=(args.interval,), daemon=True).start()
+    print(f'fake mpd on {args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+'''
+Stand-in snapserver for the snapcast client
+
+Serves the JSON-RPC control protocol on a TCP port with one group, one
+stream and a client named like this host, so ClientSnapcast finds it
+without configuration:
+
+    python test/snapserver-fake.py --port 1705 --interval 2
+
+The stream starts playing and a new track is pushed every interval
+seconds with Stream.OnProperties, in between the volume is changed
+with Client.OnVolumeChanged. Stream.Control and Client.SetVolume
+requests are applied and notified to the other connections.
+'''
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+
+
+CLIENT_ID = 'fake-client'
+GROUP_ID = 'fake-group'
+STREAM_ID = 'fake-stream'
+
+TRACKS = [
+    ('Intro', ['The xx'], 'xx', 128),
+    ('A very long song title that needs to be wrapped over multiple lines',
+     ['Artist One', 'Artist Two'], 'Album', 245),
+    ('Short', ['Band'], 'Singles', 61),
+]
+
+
+class State:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = []
+        self.track = 0
+        self.status = 'playing'
+        self.position = 0
+        self.volume = {'percent': 40, 'muted': False}
+
+    def get_properties(self):
+        title, artist, album, duration = self.track_info()
+        return {
+            'playbackStatus': self.status,
+            'position': self.position,
+            'canControl': True,
+            'metadata': {
+                'title': title, 'artist': artist, 'album': album,
+                'duration': duration}}
+
+    def track_info(self):
+        return TRACKS[self.track % len(TRACKS)]
+
+    def get_stream(self):
+        return {
+            'id': STREAM_ID,
+            'status': 'playing' if self.status == 'playing' else 'idle',
+            'uri': {'raw': f'pipe:///tmp/snapfifo?name={STREAM_ID}'},
+            'properties': self.get_properties()}
+
+    def get_server(self):
+        client = {
+            'id': CLIENT_ID,
+            'connected': True,
+            'host': {'name': socket.gethostname(), 'ip': '127.0.0.1'},
+            'config': {'name': '', 'volume': dict(self.volume)}}
+        return {
+            'groups': [{
+                'id': GROUP_ID, 'muted': False, 'name': '',
+                'stream_id': STREAM_ID, 'clients': [client]}],
+            'streams': [self.get_stream()]}
+
+    def notify(self, method, params, exclude=None):
+        msg = json.dumps(
+            {'jsonrpc': '2.0', 'method': method, 'params': params})
+        for conn in list(self.connections):
+            if conn is not exclude:
+                conn.send(msg)
+
+
+state = State()
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        self._send_lock = threading.Lock()
+        with state.lock:
+            state.connections.append(self)
+        print(f'connected: {self.client_address}')
+
+    def finish(self):
+        with state.lock:
+            state.connections.remove(self)
+        print(f'disconnected: {self.client_address}')
+        super().finish()
+
+    def send(self, msg):
+        with self._send_lock:
+            try:
+                self.wfile.write(msg.encode() + b'\r\n')
+            except OSError:
+                pass
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            print(f'request: {request}')
+            with state.lock:
+                result = self.dispatch(
+                    request['method'], request.get('params', {}))
+            self.send(json.dumps(
+                {'id': request['id'], 'jsonrpc': '2.0', 'result': result}))
+
+    def dispatch(self, method, params):
+        if method == 'Server.GetStatus':
+            return {'server': state.get_server()}
+        if method == 'Client.SetVolume':
+            state.volume.update(params['volume'])
+            state.notify(
+                'Client.OnVolumeChanged',
+                {'id': CLIENT_ID, 'volume': dict(state.volume)},
+                exclude=self)
+            return {'volume': dict(state.volume)}
+        if method == 'Stream.Control':
+            command = params['command']
+            if command == 'playPause':
+                command = 'pause' if state.status == 'playing' else 'play'
+            if command == 'play':
+                state.status = 'playing'
+            elif command == 'pause':
+                state.status = 'paused'
+            elif command in ('next', 'previous'):
+                state.track += 1 if command == 'next' else -1
+                state.position = 0
+            state.notify('Stream.OnUpdate', {
+                'id': STREAM_ID, 'stream': state.get_stream()})
+            return 'ok'
+        return None
+
+
+def push(interval):
+    # alternate between a new track and a volume change
+    step = 0
+    while True:
+        time.sleep(interval / 2)
+        with state.lock:
+            if step % 2:
+                state.track += 1
+                state.position = 0
+                state.notify('Stream.OnProperties', {
+                    'id': STREAM_ID, 'properties': state.get_properties()})
+            else:
+                state.volume['percent'] = (state.volume['percent'] + 15) % 100
+                state.notify('Client.OnVolumeChanged', {
+                    'id': CLIENT_ID, 'volume': dict(state.volume)})
+        step += 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1705)
+    parser.add_argument(
+        '--interval', type=float, default=5,
+        help='seconds between pushed tracks, 0 to disable')
+    args = parser.parse_args()
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(
+        (args.host, args.port), Handler)
+    server.daemon_threads = True
+    if args.interval:
+        threading.Thread(
+            target=push, args=(args.interval,), daemon=True).start()
+    print(f'fake snapserver on {args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+'''
+Checks that PulseEvents keeps events arriving during info queries
+
+pulsectl calls the event callback during every blocking query. A fake
+pulse connection delivers the removal of a sink input while dispatch()
+queries the new sink input, the next listen() has to return it:
+
+    python test/test-pulse-events.py
+'''
+import os
+import sys
+import time
+import collections
+
+import pulsectl
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from speaker.pulse import PulseEvents  # noqa: E402
+
+
+Event = collections.namedtuple('Event', 'facility index t')
+SinkInput = collections.namedtuple('SinkInput', 'index proplist')
+
+
+class FakePulse:
+
+    def __init__(self):
+        self.callback = None
+        self.events = []
+        self.during_query = []
+        self.sink_inputs = {}
+
+    def event_callback_set(self, callback):
+        self.callback = callback
+
+    def _deliver(self, events):
+        while events:
+            try:
+                self.callback(events.pop(0))
+            except pulsectl.PulseLoopStop:
+                return True
+        return False
+
+    def event_listen(self, timeout=None):
+        if not self._deliver(self.events):
+            time.sleep(timeout or 0)
+
+    def sink_input_list(self):
+        return list(self.sink_inputs.values())
+
+    def sink_input_info(self, index):
+        # like pulsectl, events arriving during the query are delivered
+        obj = self.sink_inputs.get(index)
+        self._deliver(self.during_query)
+        if obj is None:
+            raise pulsectl.PulseIndexError(index)
+        return obj
+
+
+class Client:
+
+    PULSE_FACILITIES = ('sink_input',)
+
+    def __init__(self):
+        self.active = False
+
+    def update_pulse(self, changes, mirror):
+        self.active = bool(mirror.get_sink_inputs('Shairport Sync'))
+
+
+def main():
+    client = Client()
+    events = PulseEvents([client])
+    pulse = events._pulse = FakePulse()
+    pulse.event_callback_set(events._on_event)
+
+    pulse.sink_inputs[1] = SinkInput(1, {'application.name': 'Shairport Sync'})
+    pulse.events = [Event('sink_input', 1, 'new')]
+    pulse.during_query = [Event('sink_input', 1, 'remove')]
+
+    first = events.listen(timeout=0.1)
+    assert [e.t for e in first] == ['new'], first
+    events.dispatch(first)
+    assert client.active
+    del pulse.sink_inputs[1]
+
+    start = time.time()
+    second = events.listen(timeout=1)
+    assert [e.t for e in second] == ['remove'], second
+    assert time.time() - start < 0.5, 'listen() waited with queued events'
+    events.dispatch(second)
+    assert not client.active
+    assert events.listen(timeout=0.1) == []
+    print('ok')
+
+
+if __name__ == '__main__':
+    main()